@@ -1,7 +1,5 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, auth, firestore # Import auth and firestore
-import pyrebase
+from firebase_admin import auth # Admin auth for user records
 import json
 import os
 import sys
@@ -17,51 +15,21 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # Add current directory to sys.path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from firebase_init import init_firestore, init_pyrebase_auth
+from shared_utils import init_summaries
 
 
 
+# Firebase Admin app, Firestore client and Pyrebase auth are created once per server process
 try:
-    if not firebase_admin._apps: # Check if app is already initialized
-        cred = credentials.Certificate({
-        "type": st.secrets["firebase_service_account"]["type"],
-        "project_id": st.secrets["firebase_service_account"]["project_id"],
-        "private_key_id": st.secrets["firebase_service_account"]["private_key_id"],
-        "private_key": st.secrets["firebase_service_account"]["private_key"],
-        "client_email": st.secrets["firebase_service_account"]["client_email"],
-        "client_id": st.secrets["firebase_service_account"]["client_id"],
-        "auth_uri": st.secrets["firebase_service_account"]["auth_uri"],
-        "token_uri": st.secrets["firebase_service_account"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase_service_account"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase_service_account"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase_service_account"]["universe_domain"]
-        })
-        #print("hehe :",st.secrets["firebase"]["project_id"])
-
-        firebase_admin.initialize_app(cred)
-except ValueError:
-    logging.error("Firebase app already initialized")
-    pass
+    db_firestore = init_firestore() # Initialize Firestore client for user data
 except Exception as e:
     logging.error(f"Error initializing Firebase Admin SDK: {e}")
     st.error("Failed to initialize authentication service. Please try again later.")
     st.stop()
 
-
-# Load Firebase config
 try:
-    
-    config = {
-        "apiKey": st.secrets["firebase"]["api_key"],
-        "authDomain": st.secrets["firebase"]["auth_domain"],
-        "projectId": st.secrets["firebase"]["project_id"],
-        "storageBucket": st.secrets["firebase"]["storage_bucket"],
-        "messagingSenderId": st.secrets["firebase"]["messaging_sender_id"],
-        "appId": st.secrets["firebase"]["app_id"],
-        "databaseURL": st.secrets["firebase"]["database_url"]
-        }
-    firebase = pyrebase.initialize_app(config)
-    auth_pb = firebase.auth()
-    db_firestore = firestore.client() # Initialize Firestore client for user data
+    auth_pb = init_pyrebase_auth()
 except Exception as e:
     logging.error(f"Error initializing Pyrebase: {e}")
     st.error("Failed to connect to authentication service. Please try again later.")
@@ -139,6 +107,7 @@ def signup_user(email, password, display_name): # Added display_name parameter
         # Store user's display name in Firestore (optional, but good for custom profiles)
         user_doc_ref = db_firestore.collection("users").document(user_id)
         user_doc_ref.set({"email": email, "username": display_name}, merge=True) # Store username in Firestore
+        init_summaries(db_firestore, user_id) # New accounts start with complete (empty) monthly summaries
 
         logging.info(f"New user account created: {user_id}")
         st.success("Account created successfully! Please login.")
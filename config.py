@@ -6,6 +6,10 @@ Global configuration settings for the WalletGenie application.
 CURRENCY = "₹"  # Indian Rupee symbol.
 CURRENCY_CODE = "INR"
 
+# Default transaction categories, used when the user hasn't defined custom ones
+DEFAULT_EXPENSE_CATEGORIES = ["Food & Dining", "Transportation", "Shopping", "Entertainment", "Bills & Utilities", "Education", "Health", "Personal Care", "Others"]
+DEFAULT_INCOME_CATEGORIES = ["Salary", "Freelance", "Investment Returns", "Gift", "Bonus", "Rental Income", "Refunds", "Other Income"]
+
 # Theme settings
 THEME = {
     "primaryColor": "#FF6B6B",  # Warm red
@@ -0,0 +1,90 @@
+# User-scoped cache namespace for WalletGenie.
+# Cached reads take (uid, data version) as part of their key. Every write path bumps the user's
+# version, so entries can live for a long time, go stale exactly when that user's data changes,
+# and are never shared between users. Writes made elsewhere (CLI jobs, other replicas) only bump
+# the version through a user's live transaction listener; users without one get a key that also
+# rolls over every UNWATCHED_REFRESH_SECONDS.
+import copy
+import threading
+import time
+
+import streamlit as st
+
+# Lifetime and size bound for version-keyed st.cache_data entries
+CACHE_TTL_SECONDS = 60 * 60
+CACHE_MAX_ENTRIES = 1000
+# How stale cached reads may get for users without a live listener
+UNWATCHED_REFRESH_SECONDS = 60
+
+
+@st.cache_resource(show_spinner=False)
+def _data_versions():
+    """Process-wide {uid: version} counters, and the users whose changes a listener reports"""
+    return {"lock": threading.Lock(), "versions": {}, "watched": set()}
+
+
+def get_data_version(uid):
+    """Get the user's current data version (part of every cached read's key; compare it, don't do arithmetic)"""
+    registry = _data_versions()
+    version = registry["versions"].get(uid, 0)
+    if uid in registry["watched"]:
+        return version, 0
+    return version, int(time.time() // UNWATCHED_REFRESH_SECONDS)
+
+
+def set_data_watched(uid, watched):
+    """Mark whether a live listener bumps this user's version for writes made outside this process"""
+    registry = _data_versions()
+    with registry["lock"]:
+        if watched:
+            registry["watched"].add(uid)
+        else:
+            registry["watched"].discard(uid)
+
+
+def bump_data_version(uid):
+    """Invalidate every cached read for this user (and only this user)"""
+    registry = _data_versions()
+    with registry["lock"]:
+        registry["versions"][uid] = registry["versions"].get(uid, 0) + 1
+        return registry["versions"][uid]
+
+
+# Small per-user lookups (categories, budget, goals) are memoized with write-through instead of
+# versioned keys: writers update the cached copy directly, and entries expire so changes made
+# from another server process are picked up eventually.
+LOOKUP_TTL_SECONDS = 5 * 60
+
+
+@st.cache_resource(show_spinner=False)
+def _lookup_store():
+    """Process-wide {(uid, name): (loaded_at, value)}"""
+    return {"lock": threading.Lock(), "entries": {}}
+
+
+def get_cached_lookup(uid, name, loader):
+    """Get a memoized lookup for this user, calling loader() on a miss. Callers get their own copy."""
+    store = _lookup_store()
+    with store["lock"]:
+        entry = store["entries"].get((uid, name))
+    if entry is None or time.monotonic() - entry[0] > LOOKUP_TTL_SECONDS:
+        entry = (time.monotonic(), loader())
+        with store["lock"]:
+            store["entries"][(uid, name)] = entry
+    return copy.deepcopy(entry[1])
+
+
+def update_cached_lookup(uid, name, update):
+    """Write-through: apply update(value) -> new value to the cached copy, if there is one"""
+    store = _lookup_store()
+    with store["lock"]:
+        entry = store["entries"].get((uid, name))
+        if entry is not None:
+            store["entries"][(uid, name)] = (entry[0], update(copy.deepcopy(entry[1])))
+
+
+def drop_cached_lookup(uid, name):
+    """Forget a memoized lookup so the next read goes to Firestore"""
+    store = _lookup_store()
+    with store["lock"]:
+        store["entries"].pop((uid, name), None)
@@ -1,25 +1,51 @@
 # firebase_init.py
+# Single initialization path for Firebase. Every client is created once per server process with
+# st.cache_resource and shared by all sessions and pages, so reruns don't re-parse credentials
+# or open new gRPC channels.
 import firebase_admin
 from firebase_admin import credentials, firestore
+import pyrebase
 import streamlit as st
 
+SERVICE_ACCOUNT_KEYS = [
+    "type", "project_id", "private_key_id", "private_key", "client_email", "client_id",
+    "auth_uri", "token_uri", "auth_provider_x509_cert_url", "client_x509_cert_url", "universe_domain",
+]
+
+@st.cache_resource(show_spinner=False)
+def get_firebase_app():
+    """Create the Firebase Admin app from the Streamlit secrets (once per process)"""
+    if firebase_admin._apps:
+        # Already initialized, e.g. by a command-line job
+        return firebase_admin.get_app()
+    service_account = st.secrets["firebase_service_account"]
+    cred = credentials.Certificate({key: service_account[key] for key in SERVICE_ACCOUNT_KEYS})
+    return firebase_admin.initialize_app(cred)
+
+@st.cache_resource(show_spinner=False)
 def init_firestore():
-    cred = credentials.Certificate({
-        "type": st.secrets["firebase_service_account"]["type"],
-        "project_id": st.secrets["firebase_service_account"]["project_id"],
-        "private_key_id": st.secrets["firebase_service_account"]["private_key_id"],
-        "private_key": st.secrets["firebase_service_account"]["private_key"],
-        "client_email": st.secrets["firebase_service_account"]["client_email"],
-        "client_id": st.secrets["firebase_service_account"]["client_id"],
-        "auth_uri": st.secrets["firebase_service_account"]["auth_uri"],
-        "token_uri": st.secrets["firebase_service_account"]["token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["firebase_service_account"]["auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["firebase_service_account"]["client_x509_cert_url"],
-        "universe_domain": st.secrets["firebase_service_account"]["universe_domain"]
-    })
-    try:
-        firebase_admin.initialize_app(cred)
-    except ValueError:
-        # Firebase already initialized
-        pass
-    return firestore.client()
+    """Get the shared Firestore client"""
+    return firestore.client(app=get_firebase_app())
+
+@st.cache_resource(show_spinner=False)
+def init_pyrebase_auth():
+    """Get the shared Pyrebase auth object used for email/password sign-in"""
+    config = {
+        "apiKey": st.secrets["firebase"]["api_key"],
+        "authDomain": st.secrets["firebase"]["auth_domain"],
+        "projectId": st.secrets["firebase"]["project_id"],
+        "storageBucket": st.secrets["firebase"]["storage_bucket"],
+        "messagingSenderId": st.secrets["firebase"]["messaging_sender_id"],
+        "appId": st.secrets["firebase"]["app_id"],
+        "databaseURL": st.secrets["firebase"]["database_url"]
+    }
+    return pyrebase.initialize_app(config).auth()
+
+
+def init_firestore_from_key_file(key_file=None):
+    """Get a Firestore client for command-line jobs, from a service account file or the Streamlit secrets"""
+    if key_file:
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(key_file))
+        return firestore.client()
+    return init_firestore()
@@ -0,0 +1,130 @@
+"""
+Backfill job that rewrites legacy MM/DD/YYYY transaction dates as ISO YYYY-MM-DD.
+
+Run it once after deploying ISO date writes so every reader can push date
+filters and ordering down to Firestore:
+
+    python migrate_dates.py                 # all users, credentials from .streamlit/secrets.toml
+    python migrate_dates.py --uid <user_id> # a single user
+    python migrate_dates.py --key-file firebase_key.json --workers 8
+
+Documents are walked in document-ID order one page at a time and each page is
+committed as a single batch on a bounded thread pool. The last fully committed
+document ID per user is saved to a checkpoint file, so an interrupted run picks
+up where it stopped. Already-migrated documents are skipped, so re-running is safe.
+"""
+import argparse
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from firebase_init import init_firestore_from_key_file
+from transaction_repository import DATE_FORMAT, to_iso_date, transactions_ref
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Firestore batches are limited to 500 operations
+PAGE_SIZE = 450
+DEFAULT_CHECKPOINT = ".migrate_dates_checkpoint.json"
+
+
+def load_checkpoint(path):
+    """Load the per-user resume cursors from the checkpoint file"""
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically write the per-user resume cursors"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _commit_page(db, updates):
+    """Commit one page of date rewrites as a single batch"""
+    batch = db.batch()
+    for doc_ref, iso_date in updates:
+        # updated_at makes running listeners and on-disk snapshots pick up the new date
+        batch.update(doc_ref, {"date": iso_date, "updated_at": firestore.SERVER_TIMESTAMP})
+    batch.commit()
+    return len(updates)
+
+
+def backfill_user(db, uid, pool, checkpoint, checkpoint_path, max_in_flight):
+    """Rewrite every non-ISO date for one user, committing pages concurrently"""
+    stats = {"scanned": 0, "updated": 0, "unparseable": []}
+    user_state = checkpoint.setdefault(uid, {"last_doc_id": None, "done": False})
+    if user_state["done"]:
+        logging.info(f"{uid}: already migrated, skipping")
+        return stats
+
+    base_query = transactions_ref(db, uid).order_by(FieldPath.document_id()).limit(PAGE_SIZE)
+    last_doc_id = user_state["last_doc_id"]
+    in_flight = deque()  # (last doc ID of the page, commit future), in page order
+
+    def drain(limit):
+        # Advance the checkpoint only past pages whose commit (and every earlier page's) has finished
+        while in_flight and (len(in_flight) > limit or in_flight[0][1].done()):
+            page_last_id, future = in_flight.popleft()
+            stats["updated"] += future.result()
+            user_state["last_doc_id"] = page_last_id
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    while True:
+        query = base_query.start_after({FieldPath.document_id(): last_doc_id}) if last_doc_id else base_query
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        updates = []
+        for doc in docs:
+            stored = doc.to_dict().get("date")
+            iso_date = to_iso_date(stored)
+            if iso_date is None:
+                stats["unparseable"].append(doc.id)
+            elif iso_date != stored:
+                updates.append((doc.reference, iso_date))
+        stats["scanned"] += len(docs)
+        last_doc_id = docs[-1].id
+
+        future = pool.submit(_commit_page, db, updates) if updates else pool.submit(lambda: 0)
+        in_flight.append((last_doc_id, future))
+        drain(max_in_flight)
+
+    drain(0)
+    user_state["done"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Rewrite legacy transaction dates as ISO ({DATE_FORMAT}).")
+    parser.add_argument("--uid", help="Only migrate this user (default: every user)")
+    parser.add_argument("--key-file", help="Service account JSON (default: .streamlit/secrets.toml)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent batch commits")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Resume file path")
+    args = parser.parse_args()
+
+    db = init_firestore_from_key_file(args.key_file)
+    checkpoint = load_checkpoint(args.checkpoint)
+    uids = [args.uid] if args.uid else [doc.id for doc in db.collection("users").list_documents()]
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for uid in uids:
+            stats = backfill_user(db, uid, pool, checkpoint, args.checkpoint, max_in_flight=args.workers * 2)
+            logging.info(f"{uid}: scanned {stats['scanned']}, rewrote {stats['updated']}")
+            if stats["unparseable"]:
+                logging.warning(f"{uid}: {len(stats['unparseable'])} documents with unparseable dates: {stats['unparseable'][:20]}")
+
+
+if __name__ == "__main__":
+    main()
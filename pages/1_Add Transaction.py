@@ -1,4 +1,3 @@
-import uuid
 import streamlit as st
 import sys
 import os
@@ -9,12 +8,18 @@ import pandas as pd
 # Add the root directory to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_guard import check_auth, get_username
-from shared_utils import get_categories  # Import from shared_utils
+from shared_utils import get_categories, import_transactions  # Import from shared_utils
+from statement_import import STATEMENT_DATE_FORMATS, count_statement_rows, iter_statement_chunks, map_statement_chunk, read_statement_columns
+from config import DEFAULT_EXPENSE_CATEGORIES, DEFAULT_INCOME_CATEGORIES
+from transaction_repository import format_tx_date, invalidate_transactions
+from write_queue import get_write_queue
 
 # Check authentication
 check_auth()
 
 db = init_firestore()
+# Adds are queued and written to Firestore in the background
+write_queue = get_write_queue()
 
 user_id = st.session_state.user_id
 
@@ -28,12 +33,21 @@ st.set_page_config(
 
 st.title("Add New Transaction 💰")
 
-# Fetch user-defined categories directly from Firestore (no caching)
+pending_writes, failed_writes = write_queue.status(user_id)
+if failed_writes:
+    st.warning(f"{failed_writes} saved transactions could not be written to the cloud yet.")
+    if st.button("Retry now"):
+        write_queue.retry_failed(user_id)
+        st.rerun()
+elif pending_writes:
+    st.caption(f"Syncing {pending_writes} recent changes...")
+
+# Fetch user-defined categories (memoized, updated in place when Settings saves them)
 user_categories = get_categories(db, user_id)
 
 # Default categories to fall back on if the user hasn't defined any custom ones
-default_expense_categories = ["Food & Dining", "Transportation", "Shopping", "Entertainment", "Bills & Utilities", "Education", "Health", "Personal Care", "Others"]
-default_income_categories = ["Salary", "Freelance", "Investment Returns", "Gift", "Bonus", "Rental Income", "Refunds", "Other Income"]
+default_expense_categories = DEFAULT_EXPENSE_CATEGORIES
+default_income_categories = DEFAULT_INCOME_CATEGORIES
 # type_categories = ["Pick type...","Expense", "Income"]
 
 expense_categories = user_categories.get("expense", [])
@@ -84,25 +98,141 @@ if submit_button:
         if category == "Others" and not custom_category:
             st.error("Please enter a custom category name.")
         else:
-            tx_id = str(uuid.uuid4())  # Unique transaction ID
-            doc_ref = db.collection("users").document(user_id).collection("transactions").document(tx_id)
-            doc_ref.set({
+            # Queued: written with its monthly summary update in the background, shown right away
+            write_queue.add_transactions(user_id, [{
                 "description": description,
                 "amount": amount,
-                "date": date.strftime("%m/%d/%Y"),
+                "date": format_tx_date(date),  # ISO YYYY-MM-DD so it sorts and range-queries correctly
                 "type": transaction_type,
                 "category": final_category
-            })
+            }])
             st.success("Transaction added successfully!")
     else:
         st.error("Please fill in all required fields.")
 
-def get_user_transactions_for_download(uid):
-    tx_ref = db.collection("users").document(uid).collection("transactions").stream()
-    return [tx.to_dict() for tx in tx_ref]
-
-tx_data = get_user_transactions_for_download(user_id)
-df = pd.DataFrame(tx_data)
+# --- Quick entry: several transactions at once ---
+st.markdown("---")
+with st.expander("🧾 Quick Entry (multiple transactions)"):
+    st.write("Enter one transaction per row, then save them all at once.")
+
+    if st.session_state.pop("quick_entry_saved", None):
+        st.success(f"Added {st.session_state.pop('quick_entry_count', 0)} transactions.")
+
+    # Changing the key clears the grid after a successful save
+    st.session_state.setdefault("quick_entry_key", 0)
+    all_categories = list(dict.fromkeys(list(expense_categories) + list(income_categories) + ["Others"]))
+    empty_grid = pd.DataFrame({
+        "date": pd.Series(dtype="object"),
+        "type": pd.Series(dtype="object"),
+        "category": pd.Series(dtype="object"),
+        "description": pd.Series(dtype="object"),
+        "amount": pd.Series(dtype="float"),
+    })
+    entries = st.data_editor(
+        empty_grid,
+        key=f"quick_entry_{st.session_state.quick_entry_key}",
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "date": st.column_config.DateColumn("Date", default=datetime.now().date(), required=True),
+            "type": st.column_config.SelectboxColumn("Type", options=["Expense", "Income"], default="Expense", required=True),
+            "category": st.column_config.SelectboxColumn("Category", options=all_categories, required=True),
+            "description": st.column_config.TextColumn("Description"),
+            "amount": st.column_config.NumberColumn("Amount (₹)", min_value=0.01, format="%.2f", required=True),
+        },
+    )
+
+    if st.button("Save All", key="quick_entry_save"):
+        rows = entries.dropna(how="all")
+        incomplete = rows[rows[["date", "type", "category", "amount"]].isna().any(axis=1)]
+        if rows.empty:
+            st.error("Add at least one row first.")
+        elif not incomplete.empty:
+            st.error("Every row needs a date, type, category and amount.")
+        else:
+            # The queue writes the rows (and their summary increments) in as few batches as possible
+            write_queue.add_transactions(user_id, [
+                {
+                    "description": row.description if isinstance(row.description, str) else "",
+                    "amount": float(row.amount),
+                    "date": format_tx_date(row.date),
+                    "type": row.type,
+                    "category": row.category,
+                }
+                for row in rows.itertuples(index=False)
+            ])
+            st.session_state.quick_entry_saved = True
+            st.session_state.quick_entry_count = len(rows)
+            st.session_state.quick_entry_key += 1
+            st.rerun()
+
+# --- Bulk import from a bank statement ---
+st.markdown("---")
+with st.expander("📥 Import Bank Statement (CSV / XLSX)"):
+    st.write("Upload a statement and map its columns to WalletGenie's fields. Large files are read and written in chunks.")
+    statement_file = st.file_uploader("Statement file", type=["csv", "xlsx"], key="statement_file")
+
+    if statement_file is not None:
+        try:
+            statement_columns = read_statement_columns(statement_file, statement_file.name)
+        except Exception as e:
+            st.error(f"Could not read the statement: {e}")
+            statement_columns = []
+
+        if statement_columns:
+            NONE_OPTION = "— none —"
+            map_col1, map_col2 = st.columns(2)
+            with map_col1:
+                date_column = st.selectbox("Date column", statement_columns, key="import_date_column")
+                description_column = st.selectbox("Description column", [NONE_OPTION] + statement_columns, key="import_description_column")
+                amount_column = st.selectbox("Amount column", statement_columns, key="import_amount_column")
+            with map_col2:
+                date_format_label = st.selectbox("Date format", list(STATEMENT_DATE_FORMATS), key="import_date_format")
+                type_column = st.selectbox(
+                    "Type column (Debit/Credit or Expense/Income)", [NONE_OPTION] + statement_columns, key="import_type_column",
+                    help="Without a type column, negative amounts are imported as expenses and positive amounts as income."
+                )
+                category_column = st.selectbox("Category column", [NONE_OPTION] + statement_columns, key="import_category_column")
+
+            column_map = {
+                "date": date_column,
+                "description": None if description_column == NONE_OPTION else description_column,
+                "amount": amount_column,
+                "type": None if type_column == NONE_OPTION else type_column,
+                "category": None if category_column == NONE_OPTION else category_column,
+            }
+
+            if st.button("Import Transactions", type="primary"):
+                total_rows = count_statement_rows(statement_file, statement_file.name)
+                progress_bar = st.progress(0.0, text="Importing...")
+                skipped_rows = 0
+
+                def mapped_chunks():
+                    # Parse one chunk at a time so only a chunk of rows is in memory
+                    global skipped_rows
+                    for chunk in iter_statement_chunks(statement_file, statement_file.name):
+                        transactions, skipped = map_statement_chunk(chunk, column_map, STATEMENT_DATE_FORMATS[date_format_label])
+                        skipped_rows += skipped
+                        yield transactions
+
+                def show_import_progress(imported):
+                    done = imported + skipped_rows
+                    progress_bar.progress(min(done / total_rows, 1.0) if total_rows else 1.0, text=f"Imported {imported:,} transactions")
+
+                try:
+                    imported, failed = import_transactions(db, user_id, mapped_chunks(), progress_callback=show_import_progress)
+                    progress_bar.progress(1.0, text=f"Imported {imported:,} transactions")
+                    st.success(f"Imported {imported:,} transactions.")
+                    if failed:
+                        st.error(f"{failed:,} transactions could not be written and were not imported.")
+                    if skipped_rows:
+                        st.warning(f"Skipped {skipped_rows:,} rows with a missing or unparseable date, amount or type.")
+                except Exception as e:
+                    st.error(f"Import failed: {e}")
+                finally:
+                    # A failed import may still have written some chunks
+                    invalidate_transactions(user_id)
 
 # Logout button
 st.sidebar.button("Logout", on_click=lambda: st.session_state.update({"logged_in": False}))
\ No newline at end of file
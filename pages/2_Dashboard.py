@@ -6,8 +6,6 @@ import random
 from datetime import datetime, timedelta
 import sys
 import os
-import firebase_admin 
-from firebase_admin import credentials, firestore
 import plotly.express as px 
 import numpy as np # Ensure numpy is imported for potential use if needed
 #from shared_utils import get_categories
@@ -16,19 +14,12 @@ import numpy as np # Ensure numpy is imported for potential use if needed
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_guard import check_auth, get_username
 from config import CURRENCY, THEME, CUSTOM_CSS
+from firebase_init import init_firestore
+from transaction_repository import aggregate_transactions, from_minor_units, get_monthly_summaries, get_transaction_cube, month_bounds
 
 # Check authentication
 check_auth()
-if not firebase_admin._apps:
-    try: # Added try-except for robustness during firebase init
-        cred = credentials.Certificate("firebase_key.json")  # Replace with your JSON file path
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error(f"Error initializing Firebase: {e}. Please ensure 'firebase_key.json' is correctly placed and valid.")
-        st.stop() # Stop the app if Firebase can't be initialized
-
-
-db = firestore.client()
+db = init_firestore()
 
 user_id = st.session_state.user_id
 
@@ -56,43 +47,34 @@ st.title(f"Welcome back, {get_username()}! 👋")
 
 
 ################################################################################
-# Get user transactions from Firestore
-@st.cache_data(ttl=60) # Cache transaction data for performance
-def get_user_transactions(uid):
-    tx_ref = db.collection("users").document(uid).collection("transactions").stream()
-    return [tx.to_dict() for tx in tx_ref]
-
-tx_data = get_user_transactions(user_id)
-
-# Convert to DataFrame
-df = pd.DataFrame(tx_data)
-
-# Ensure 'amount', 'type', 'date', and 'category' columns exist and are correctly typed
-if not df.empty and all(col in df.columns for col in ['amount', 'type', 'date', 'category']):
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    df['type'] = df['type'].str.lower().str.strip()  # make sure type is lowercase for comparison
-    df['category'] = df['category'].astype(str) # Ensure category is string
-    df.dropna(subset=['amount', 'date', 'type', 'category'], inplace=True) # Drop rows with invalid data
-
-    # Calculate current month and year financial summary
-    now = pd.Timestamp.now()
-    current_month_df = df[(df['date'].dt.month == now.month) & (df['date'].dt.year == now.year)]
-    monthly_income = current_month_df[current_month_df['type'] == 'income']['amount'].sum()
-    monthly_spend = current_month_df[current_month_df['type'] == 'expense']['amount'].sum()
-    total_income = df[df['type'] == 'income']['amount'].sum()
-    total_spend = df[df['type'] == 'expense']['amount'].sum()
-    total_balance = total_income - total_spend
-    df_expenses = df[df['type'] == 'expense'].copy() # Use .copy() to avoid SettingWithCopyWarning
-    df_income = df[df['type'] == 'income'].copy() # Also create df for income
+# Key metrics come from the pre-aggregated users/{uid}/summaries/{YYYY-MM} documents (one read per month)
+now = pd.Timestamp.now()
+summaries = get_monthly_summaries(db, user_id)
+if summaries is not None:
+    current_month_totals = summaries.get(now.strftime("%Y-%m"), {}).get("totals", {})
+    monthly_income = current_month_totals.get("income", 0.0)
+    monthly_spend = current_month_totals.get("expense", 0.0)
+    total_income = sum(summary.get("totals", {}).get("income", 0.0) for summary in summaries.values())
+    total_spend = sum(summary.get("totals", {}).get("expense", 0.0) for summary in summaries.values())
 else:
-    # Initialize variables and empty DataFrames if main DataFrame is empty or missing columns
-    monthly_income = 0.0
-    monthly_spend = 0.0
-    total_balance = 0.0
-    df_expenses = pd.DataFrame(columns=['amount', 'date', 'type', 'category']) # Ensure df_expenses is always a DataFrame
-    df_income = pd.DataFrame(columns=['amount', 'date', 'type', 'category']) # Ensure df_income is also a DataFrame
-    df = pd.DataFrame(columns=['amount', 'date', 'type', 'category']) # Ensure df is also empty but with columns
+    # Summaries were never built for this account (run rebuild_summaries.py); use server-side sum() aggregations
+    month_start, month_end = month_bounds(now.year, now.month)
+    _, monthly_income = aggregate_transactions(db, user_id, tx_type="income", start_date=month_start, end_date=month_end)
+    _, monthly_spend = aggregate_transactions(db, user_id, tx_type="expense", start_date=month_start, end_date=month_end)
+    _, total_income = aggregate_transactions(db, user_id, tx_type="income")
+    _, total_spend = aggregate_transactions(db, user_id, tx_type="expense")
+total_balance = total_income - total_spend
+
+# Every chart is built from one day x type x category cube (computed once per data version), so the
+# data sent to the browser grows with days and categories rather than with transactions
+cube = get_transaction_cube(db, user_id)
+cube_expenses = cube[cube['type'] == 'expense']
+cube_income = cube[cube['type'] == 'income']
+
+def category_totals_of(cube_type):
+    """Total amount per category (observed=True skips categories that only occur for the other type)"""
+    totals = cube_type.groupby("category", observed=True)["amount_minor"].sum().sort_values(ascending=False)
+    return from_minor_units(totals).rename("amount")
 
 # --- Key Metrics ---
 st.subheader("Current Financial Summary")
@@ -119,9 +101,9 @@ st.subheader("Your Financial Insights")
 
 # 1. Monthly Spending Trend / Daily Spending Pattern
 st.markdown("#### Daily Spending Trend")
-if not df.empty:
-    # Group by date (only date part) and sum the amounts
-    daily_totals = df.groupby(df["date"].dt.date)["amount"].sum().reset_index()
+if not cube.empty:
+    # Sum the cube's cells for each day
+    daily_totals = from_minor_units(cube.groupby(cube["date"].dt.date)["amount_minor"].sum()).rename("amount").reset_index()
 
     daily_totals.rename(columns={"date": "Date", "amount": "Amount"}, inplace=True)
     fig_trend = px.line(
@@ -143,8 +125,8 @@ col_charts_expense_1, col_charts_expense_2 = st.columns(2)
 
 with col_charts_expense_1:
     st.markdown("#### Expense Breakdown by Category")
-    if not df_expenses.empty:
-        category_totals = df_expenses.groupby("category")["amount"].sum().sort_values(ascending=False)
+    if not cube_expenses.empty:
+        category_totals = category_totals_of(cube_expenses)
         fig_bar_expense = px.bar(
             category_totals,
             title="Total Spending by Category",
@@ -161,9 +143,9 @@ with col_charts_expense_1:
 
 with col_charts_expense_2:
     st.markdown("#### Expense Distribution")
-    if not df_expenses.empty:
+    if not cube_expenses.empty:
         fig_pie_expense = px.pie(
-            df_expenses,
+            category_totals_of(cube_expenses).reset_index(),
             values="amount",
             names="category",
             title="Proportion of Expenses by Category",
@@ -181,8 +163,8 @@ col_charts_income_1, col_charts_income_2 = st.columns(2)
 
 with col_charts_income_1:
     st.markdown("#### Income Breakdown by Category")
-    if not df_income.empty:
-        income_category_totals = df_income.groupby("category")["amount"].sum().sort_values(ascending=False)
+    if not cube_income.empty:
+        income_category_totals = category_totals_of(cube_income)
         fig_bar_income = px.bar(
             income_category_totals,
             title="Total Income by Category",
@@ -199,9 +181,9 @@ with col_charts_income_1:
 
 with col_charts_income_2:
     st.markdown("#### Income Distribution")
-    if not df_income.empty:
+    if not cube_income.empty:
         fig_pie_income = px.pie(
-            df_income,
+            category_totals_of(cube_income).reset_index(),
             values="amount",
             names="category",
             title="Proportion of Income by Category",
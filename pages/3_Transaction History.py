@@ -2,21 +2,29 @@ import streamlit as st
 import pandas as pd
 import sys
 import os
-import firebase_admin
-from firebase_admin import firestore
-from datetime import datetime
 
 # Add the root directory to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_guard import check_auth, get_username
 from firebase_init import init_firestore
-from config import CURRENCY # Assuming CURRENCY is defined in config.py
+from config import CURRENCY, DEFAULT_EXPENSE_CATEGORIES, DEFAULT_INCOME_CATEGORIES
+from shared_utils import get_categories
+from transaction_repository import (
+    aggregate_transactions, apply_transaction_updates, format_tx_date, from_minor_units, get_monthly_summaries, get_transactions,
+    get_transactions_page, iter_transaction_chunks,
+)
+from transaction_export import EXPORT_FORMATS, export_transactions
+from transaction_filters import filter_transactions
+from transaction_search import search_descriptions
+from write_queue import get_write_queue
 
 # Check authentication
 check_auth()
 
 # Initialize Firebase DB client
 db = init_firestore()
+# Deletes are queued and written to Firestore in the background
+write_queue = get_write_queue()
 
 # --- IMPORTANT: Replace with dynamic user ID ---
 user_id = st.session_state.user_id
@@ -32,137 +40,252 @@ st.set_page_config(
 st.title("Transaction History 📜")
 st.write("View and manage all your past transactions.")
 
-# Function to get user transactions from Firestore
-def get_user_transactions(uid):
-    transactions = []
-    # Fetch transactions from the 'transactions' subcollection for the specific user
-    tx_ref = db.collection("users").document(uid).collection("transactions").order_by("date", direction=firestore.Query.DESCENDING).stream()
-    for tx in tx_ref:
-        tx_data = tx.to_dict()
-        tx_data['id'] = tx.id # Add document ID for potential future delete/edit
-        transactions.append(tx_data)
-    return transactions
-
-# Fetch transactions
-tx_data = get_user_transactions(user_id)
-
-if tx_data:
-    df = pd.DataFrame(tx_data)
-
-    # Convert 'date' column to datetime objects for proper sorting and filtering
-    df['date'] = pd.to_datetime(df['date'], errors='coerce', format='%m/%d/%Y')
-    df.dropna(subset=['date'], inplace=True) # Remove rows where date conversion failed
-
-    # Sort by date descending by default
-    df = df.sort_values(by='date', ascending=False)
-
-    # Display total transactions count
-    st.info(f"Total Transactions: **{len(df)}**")
-
-    # Filters
-    st.subheader("Filter Transactions")
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        # Filter by type
-        transaction_type_filter = st.selectbox("Filter by Type", ["All", "Expense", "Income"])
-        if transaction_type_filter != "All":
-            df = df[df['type'].str.lower() == transaction_type_filter.lower()]
-
-    with col2:
-        # Filter by category (get unique categories from current filtered DataFrame)
-        all_categories = df['category'].unique().tolist()
-        category_filter = st.selectbox("Filter by Category", ["All"] + sorted(all_categories))
-        if category_filter != "All":
-            df = df[df['category'] == category_filter]
-
-    with col3:
-        # Date range filter
-        min_date = df['date'].min().date() if not df.empty else datetime.today().date()
-        max_date = df['date'].max().date() if not df.empty else datetime.today().date()
-        date_range = st.date_input("Filter by Date Range",
-                                  value=(min_date, max_date),
-                                  min_value=min_date,
-                                  max_value=max_date)
-
-        if len(date_range) == 2:
-            start_date, end_date = date_range
-            df = df[(df['date'].dt.date >= start_date) & (df['date'].dt.date <= end_date)]
-        elif len(date_range) == 1: # Handle case where only one date is selected (e.g., in calendar)
-            start_date = date_range[0]
-            df = df[df['date'].dt.date == start_date]
-
-    with col4:
-        # Search by description
-        search_query = st.text_input("Search by Description", "").strip()
-        if search_query:
-            df = df[df['description'].str.contains(search_query, case=False, na=False)]
+# The grid is virtualized, so even large pages render quickly
+PAGE_SIZE_OPTIONS = [100, 1000, 5000, 10000]
+
+# Pagination state: history_cursors[i] is the cursor page i+1 starts after (None for the first page).
+# While searching, the cursor is the row offset into the search results instead.
+if "history_cursors" not in st.session_state:
+    st.session_state.history_cursors = [None]
+
+def reset_pagination():
+    st.session_state.history_cursors = [None]
+
+def go_to_next_page(cursor):
+    st.session_state.history_cursors.append(cursor)
+
+def go_to_previous_page():
+    if len(st.session_state.history_cursors) > 1:
+        st.session_state.history_cursors.pop()
+
+# Filters (type, category and date range run as Firestore where() clauses; any change restarts at page 1)
+st.subheader("Filter Transactions")
+col1, col2, col3, col4 = st.columns(4)
+
+with col1:
+    transaction_type_filter = st.selectbox("Filter by Type", ["All", "Expense", "Income"], on_change=reset_pagination)
+
+with col2:
+    # Category options are the user's categories plus every category actually used (custom ones typed
+    # on Add Transaction or imported aren't in the user's list), read from the monthly summaries
+    user_categories = get_categories(db, user_id)
+    all_categories = set(user_categories.get("expense", []) or DEFAULT_EXPENSE_CATEGORIES)
+    all_categories |= set(user_categories.get("income", []) or DEFAULT_INCOME_CATEGORIES)
+    summaries = get_monthly_summaries(db, user_id)
+    if summaries is None:
+        # Summaries were never built for this account; fall back to the transactions themselves
+        all_categories |= set(get_transactions(db, user_id)['category'].astype(str))
+    else:
+        for summary in summaries.values():
+            for type_categories in summary.get("categories", {}).values():
+                all_categories |= {category for category, totals in type_categories.items() if totals.get("count", 0) > 0}
+    category_filter = st.selectbox("Filter by Category", ["All"] + sorted(all_categories), on_change=reset_pagination)
+
+with col3:
+    # Date range filter (empty means all dates)
+    date_range = st.date_input("Filter by Date Range", value=(), on_change=reset_pagination)
+    start_date = end_date = None
+    if len(date_range) == 2:
+        start_date, end_date = date_range
+    elif len(date_range) == 1: # Handle case where only one date is selected (e.g., in calendar)
+        start_date = end_date = date_range[0]
+
+with col4:
+    # Description search can't be expressed as a Firestore query; it runs on the user's in-memory description index
+    search_query = st.text_input("Search by Description", "", on_change=reset_pagination).strip()
+
+filters_active = transaction_type_filter != "All" or category_filter != "All" or start_date is not None
+page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, key="history_page_size", on_change=reset_pagination)
+page_number = len(st.session_state.history_cursors)
+
+query_filters = {
+    "tx_type": None if transaction_type_filter == "All" else transaction_type_filter,
+    "category": None if category_filter == "All" else category_filter,
+    "start_date": start_date,
+    "end_date": end_date,
+}
+
+if search_query:
+    # Search every transaction, not just one page: the index returns the matching IDs, the other
+    # filters come from the memoized filter engine over the listener's copy (which includes queued writes)
+    matching_ids = search_descriptions(db, user_id, search_query)
+    results = filter_transactions(db, user_id, **query_filters)
+    results = results[results['id'].isin(matching_ids)]
+    offset = st.session_state.history_cursors[-1] or 0
+    df = results.iloc[offset:offset + page_size]
+    next_cursor = offset + page_size if offset + page_size < len(results) else None
+    total_count = len(results)
+else:
+    # Fetch only the visible page of matching transactions (already normalized and sorted by date descending)
+    df, next_cursor = get_transactions_page(db, user_id, page_size, st.session_state.history_cursors[-1], **query_filters)
+    # Hide rows whose delete is still queued and show edits that haven't been written yet
+    pending_deletes = write_queue.pending_deletes(user_id)
+    if pending_deletes:
+        df = df[~df['id'].isin(pending_deletes)]
+    pending_updates = write_queue.pending_updates(user_id)
+    if pending_updates:
+        df = apply_transaction_updates(df, pending_updates)
+
+# A page can empty out after deletes; fall back to the first page
+if df.empty and page_number > 1:
+    reset_pagination()
+    st.rerun()
+
+if not df.empty:
+    # Display total matching transactions (a single count() aggregation unless searching) and the page position
+    if not search_query:
+        total_count, _ = aggregate_transactions(db, user_id, **query_filters)
+    total_pages = max(1, -(-total_count // page_size))
+    st.info(f"Total Transactions: **{total_count}** · page **{page_number}** of **{total_pages}**")
 
     # Display the filtered data
     st.subheader("Filtered Transactions")
 
-    # Format amount for display
-    df['amount_display'] = df.apply(
-        lambda row: f"{CURRENCY} {row['amount']:,.2f}", axis=1
-    )
-    df['date_display'] = df['date'].dt.strftime('%Y-%m-%d')
-
-    # Function to delete a transaction
-    def delete_transaction(tx_id):
-        if st.session_state.get(f"confirm_delete_{tx_id}", False):
-            # Delete the transaction
-            db.collection("users").document(user_id).collection("transactions").document(tx_id).delete()
-            st.session_state[f"delete_success"] = True
-            st.session_state[f"confirm_delete_{tx_id}"] = False
-            st.rerun()
-        else:
-            st.session_state[f"confirm_delete_{tx_id}"] = True
-
-    # Show success message if a transaction was deleted
-    if st.session_state.get("delete_success", False):
-        st.success("Transaction deleted successfully!")
-        st.session_state["delete_success"] = False
-
-    if not df.empty:
-        # Display each transaction with a delete button
-        for i, row in df.iterrows():
-            col1, col2, col3, col4, col5, col6 = st.columns([2, 4, 2, 2, 2, 1])
-            
-            with col1:
-                st.write(row['date_display'])
-            with col2:
-                st.write(row['description'])
-            with col3:
-                st.write(row['category'])
-            with col4:
-                st.write(row['type'])
-            with col5:
-                st.write(row['amount_display'])
-            with col6:
-                tx_id = row['id']
-                if st.session_state.get(f"confirm_delete_{tx_id}", False):
-                    if st.button("✓", key=f"confirm_{tx_id}", type="primary"):
-                        delete_transaction(tx_id)
-                    if st.button("✗", key=f"cancel_{tx_id}"):
-                        st.session_state[f"confirm_delete_{tx_id}"] = False
-                        st.rerun()
-                else:
-                    st.button("🗑️", key=f"delete_{tx_id}", on_click=lambda tx_id=tx_id: delete_transaction(tx_id))
-            
-            st.markdown("---")
+    # Show success message after a delete or an edit
+    deleted_count = st.session_state.pop("delete_success", 0)
+    if deleted_count:
+        st.success(f"Deleted {deleted_count} transaction{'s' if deleted_count != 1 else ''}.")
+    updated_count = st.session_state.pop("update_success", 0)
+    if updated_count:
+        st.success(f"Saved changes to {updated_count} transaction{'s' if updated_count != 1 else ''}.")
+
+    # One virtualized grid sent to the browser as Arrow, instead of a row of widgets per transaction
+    grid = pd.DataFrame({
+        "Date": df['date'].dt.date,
+        "Description": df['description'],
+        "Category": df['category'].astype(str),
+        "Type": df['type'].astype(str),
+        "Amount": from_minor_units(df['amount_minor']),
+    })
+    grid.index = df['id']
+    grid_ids = df['id'].tolist()
+    # A new key (new page, filters, a delete or a save) starts the grid with nothing selected or edited
+    grid_key = f"history_grid_{page_number}_{hash((page_size, tuple(query_filters.values()), search_query))}_{st.session_state.get('history_grid_version', 0)}"
+    edit_mode = st.toggle("✏️ Edit transactions", key="history_edit_mode")
+
+    if edit_mode:
+        edited = st.data_editor(
+            grid,
+            key=f"{grid_key}_edit",
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Date": st.column_config.DateColumn("Date", format="YYYY-MM-DD", required=True),
+                "Category": st.column_config.SelectboxColumn("Category", options=sorted(all_categories | set(grid["Category"])), required=True),
+                "Type": st.column_config.SelectboxColumn("Type", options=["expense", "income"], required=True),
+                "Amount": st.column_config.NumberColumn(f"Amount ({CURRENCY})", min_value=0.01, format="%.2f", required=True),
+            },
+        )
+
+        # Diff the grid cell by cell so only the fields that changed are written
+        changed_cells = {
+            "Date": edited["Date"] != grid["Date"],
+            "Description": edited["Description"] != grid["Description"],
+            "Category": edited["Category"] != grid["Category"],
+            "Type": edited["Type"] != grid["Type"],
+            "Amount": (edited["Amount"] * 100).round() != (grid["Amount"] * 100).round(),
+        }
+        to_stored = {
+            "Date": ("date", format_tx_date),
+            "Description": ("description", str),
+            "Category": ("category", str),
+            "Type": ("type", lambda value: value.capitalize()),
+            "Amount": ("amount", lambda value: round(float(value), 2)),
+        }
+        updates = {}
+        missing_values = False
+        for column, changed in changed_cells.items():
+            field, convert = to_stored[column]
+            for tx_id, value in edited.loc[changed, column].items():
+                if pd.isna(value) and column != "Description":
+                    missing_values = True
+                    continue
+                updates.setdefault(tx_id, {})[field] = "" if pd.isna(value) else convert(value)
+
+        if missing_values:
+            st.error("Every transaction needs a date, category, type and amount.")
+        elif updates:
+            if st.button(f"💾 Save changes to {len(updates)} transaction{'s' if len(updates) != 1 else ''}", type="primary"):
+                # Queued as one batch of updates; the affected monthly summaries are adjusted in the same write
+                write_queue.update_transactions(user_id, updates)
+                st.session_state.update_success = len(updates)
+                st.session_state.history_grid_version = st.session_state.get("history_grid_version", 0) + 1
+                st.rerun()
     else:
-        st.warning("No transactions match the selected filters.")
-
-    # Option to download filtered data
-    if not df.empty:
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="Download Transactions as CSV",
-            data=csv,
-            file_name="filtered_transactions.csv",
-            mime="text/csv",
+        grid_state = st.dataframe(
+            grid,
+            key=grid_key,
+            hide_index=True,
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="multi-row",
+            column_config={
+                "Date": st.column_config.DateColumn("Date", format="YYYY-MM-DD"),
+                "Amount": st.column_config.NumberColumn(f"Amount ({CURRENCY})", format="%.2f"),
+            },
         )
+        selected_ids = [grid_ids[row] for row in grid_state.selection.rows if row < len(grid_ids)]
+
+        if selected_ids:
+            if st.session_state.get("confirm_bulk_delete", False):
+                st.warning(f"Delete {len(selected_ids)} selected transaction{'s' if len(selected_ids) != 1 else ''}? This can't be undone.")
+                confirm_col, cancel_col, _ = st.columns([1, 1, 4])
+                with confirm_col:
+                    if st.button("✓ Delete", type="primary", use_container_width=True):
+                        # Queued as one batch: the rows and their monthly summaries are updated in a single write
+                        write_queue.delete_transactions(user_id, selected_ids)
+                        st.session_state.delete_success = len(selected_ids)
+                        st.session_state.confirm_bulk_delete = False
+                        st.session_state.history_grid_version = st.session_state.get("history_grid_version", 0) + 1
+                        st.rerun()
+                with cancel_col:
+                    if st.button("✗ Cancel", use_container_width=True):
+                        st.session_state.confirm_bulk_delete = False
+                        st.rerun()
+            else:
+                st.button(f"🗑️ Delete {len(selected_ids)} selected", on_click=lambda: st.session_state.update(confirm_bulk_delete=True))
+
+    # Page navigation
+    prev_col, _, next_col = st.columns([1, 4, 1])
+    with prev_col:
+        st.button("← Previous", disabled=page_number == 1, on_click=go_to_previous_page, use_container_width=True)
+    with next_col:
+        st.button("Next →", disabled=next_cursor is None, on_click=go_to_next_page, args=(next_cursor,), use_container_width=True)
+
+    # Export every matching transaction (not just this page). The file is only built when requested,
+    # streamed from Firestore in chunks, and kept until it is downloaded or the filters or format change.
+    st.subheader("Export Transactions")
+    export_col1, export_col2 = st.columns(2)
+    with export_col1:
+        export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key="export_format")
+    export_key = (export_format, tuple(query_filters.values()), search_query)
+    if st.session_state.get("history_export", (None,))[0] != export_key:
+        st.session_state.pop("history_export", None)  # Drop exports built for other filters
+
+    with export_col2:
+        if st.button("Prepare Export", use_container_width=True):
+            chunks = iter_transaction_chunks(db, user_id, **query_filters)
+            if search_query:
+                chunks = (chunk[chunk['id'].isin(matching_ids)] for chunk in chunks)
+            with st.spinner("Preparing export..."):
+                st.session_state.history_export = (export_key, export_transactions(chunks, export_format))
+
+        if "history_export" in st.session_state:
+            extension, mime = EXPORT_FORMATS[export_format]
+            st.download_button(
+                label=f"Download Transactions ({export_format})",
+                data=st.session_state.history_export[1],
+                file_name=f"transactions.{extension}",
+                mime=mime,
+                use_container_width=True,
+                # The file has been handed to the browser; don't keep a copy in the session
+                on_click=lambda: st.session_state.pop("history_export", None),
+            )
 
+elif search_query:
+    st.warning("No transactions match the description search.")
+elif filters_active:
+    st.warning("No transactions match the selected filters.")
 else:
     st.info("No transactions recorded yet. Add some transactions using the 'Add Transaction' page!")
 
@@ -20,6 +20,7 @@ warnings.filterwarnings('ignore')
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_guard import check_auth, get_username
 from firebase_init import init_firestore
+from transaction_repository import from_minor_units, get_transactions
 
 # Check authentication
 check_auth()
@@ -66,27 +67,15 @@ st.title("AI Predictions 🔮")
 st.write("Let's peek into your financial future with machine learning!")
 
 # Function to load transaction data
-@st.cache_data(ttl=300)
 def load_transaction_data():
-    """Load transaction data from Firestore"""
+    """Load transaction data from the shared transaction repository"""
     try:
-        # Get data from Firestore
-        transactions = []
-        # Fetch transactions from the 'transactions' subcollection for the specific user
-        tx_ref = db.collection("users").document(user_id).collection("transactions").stream()
-        for tx in tx_ref:
-            tx_data = tx.to_dict()
-            tx_data['id'] = tx.id
-            transactions.append(tx_data)
-        
-        if transactions:
-            df = pd.DataFrame(transactions)
-            # Ensure date is in datetime format
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                df.dropna(subset=['date'], inplace=True)  # Remove rows where date conversion failed
+        df = get_transactions(db, user_id)
+        if not df.empty:
+            # The models work in rupees; the repository keeps amounts in paise
+            df['amount'] = from_minor_units(df['amount_minor'])
             return df
-        
+
         # If no transactions found, generate sample data
         st.info("No transactions found. Using sample data for demonstration.")
         return generate_sample_data()
@@ -467,7 +456,7 @@ if not df.empty:
         
         if len(categories) >= 2:  # Need at least 2 categories for basic clustering
             # Aggregate expenses by category
-            category_expenses = expense_df.groupby('category')['amount'].agg(['sum', 'mean', 'count']).reset_index()
+            category_expenses = expense_df.groupby('category', observed=True)['amount'].agg(['sum', 'mean', 'count']).reset_index()
             
             # Prepare features for clustering
             X = category_expenses[['sum', 'mean', 'count']].copy()
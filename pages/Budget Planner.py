@@ -1,10 +1,7 @@
 import streamlit as st
 import sys
 import os
-import pandas as pd
-from datetime import datetime, timedelta
-import firebase_admin
-from firebase_admin import firestore
+from datetime import datetime
 
 # Add the root directory to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,6 +9,7 @@ from auth_guard import check_auth, get_username
 from firebase_init import init_firestore
 from config import CURRENCY, THEME, CUSTOM_CSS
 from shared_utils import get_categories, get_budget, update_budget
+from transaction_repository import aggregate_transactions, month_bounds
 
 # Check authentication
 check_auth()
@@ -109,39 +107,18 @@ else:
 
 
 
-# --- Fetch current month's transactions for 'spent' calculation ---
-@st.cache_data(ttl=60) # Cache for 60 seconds
-def get_current_month_expenses(uid):
-    """Get current month's expenses from Firestore"""
-    transactions_ref = db.collection("users").document(uid).collection("transactions")
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-
-    # Get all transactions
-    all_tx_docs = [doc.to_dict() for doc in transactions_ref.stream()]
-    df_all_tx = pd.DataFrame(all_tx_docs)
-
-    if not df_all_tx.empty and 'date' in df_all_tx.columns:
-        # Handle both date formats (MM/DD/YYYY and YYYY-MM-DD)
-        df_all_tx['date'] = pd.to_datetime(df_all_tx['date'], format='mixed', errors='coerce')
-        df_all_tx = df_all_tx.dropna(subset=['date', 'amount', 'type', 'category'])
-        
-        # Filter for current month expenses
-        df_current_month = df_all_tx[
-            (df_all_tx['date'].dt.month == current_month) &
-            (df_all_tx['date'].dt.year == current_year) &
-            (df_all_tx['type'].str.lower() == 'expense')
-        ].copy()
-        
-        # Convert amount to absolute value for expense calculations
-        df_current_month['amount'] = pd.to_numeric(df_current_month['amount'], errors='coerce').abs()
-        return df_current_month
-    return pd.DataFrame()
-
-current_month_expenses_df = get_current_month_expenses(user_id)
-actual_spent_by_category = {}
-if not current_month_expenses_df.empty:
-    actual_spent_by_category = current_month_expenses_df.groupby('category')['amount'].sum().to_dict()
+# --- Aggregate current month's spending per category for 'spent' calculation ---
+def get_current_month_spent(uid, categories):
+    """Sum current month's expenses per category with server-side aggregation queries"""
+    now = datetime.now()
+    month_start, month_end = month_bounds(now.year, now.month)
+    spent = {}
+    for category_name in categories:
+        _, total = aggregate_transactions(db, uid, tx_type="expense", category=category_name, start_date=month_start, end_date=month_end)
+        spent[category_name] = abs(total)
+    return spent
+
+actual_spent_by_category = get_current_month_spent(user_id, list(budget_categories))
 
 # Update 'spent' values in budget_categories
 for category_name, data in budget_categories.items():
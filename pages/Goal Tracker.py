@@ -4,40 +4,20 @@ import pandas as pd
 from datetime import datetime, timedelta
 import sys
 import os
-import firebase_admin
-from firebase_admin import firestore
 import uuid
 
 # Add the root directory to the path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth_guard import check_auth, get_username
-from shared_utils import get_goals, add_goal, update_goal, delete_goal
+from firebase_init import init_firestore
+from shared_utils import get_goals, add_goal, delete_goal
+from write_queue import get_write_queue
 
 # Check authentication
 check_auth()
 
 # Initialize Firebase
-if not firebase_admin._apps:
-    try:
-        cred = firebase_admin.credentials.Certificate({
-            "type": st.secrets["firebase_service_account"]["type"],
-            "project_id": st.secrets["firebase_service_account"]["project_id"],
-            "private_key_id": st.secrets["firebase_service_account"]["private_key_id"],
-            "private_key": st.secrets["firebase_service_account"]["private_key"],
-            "client_email": st.secrets["firebase_service_account"]["client_email"],
-            "client_id": st.secrets["firebase_service_account"]["client_id"],
-            "auth_uri": st.secrets["firebase_service_account"]["auth_uri"],
-            "token_uri": st.secrets["firebase_service_account"]["token_uri"],
-            "auth_provider_x509_cert_url": st.secrets["firebase_service_account"]["auth_provider_x509_cert_url"],
-            "client_x509_cert_url": st.secrets["firebase_service_account"]["client_x509_cert_url"],
-            "universe_domain": st.secrets["firebase_service_account"]["universe_domain"]
-        })
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error(f"Error initializing Firebase: {e}. Please ensure '.streamlit/secrets.toml' is correctly configured.")
-        st.stop()
-
-db = firestore.client()
+db = init_firestore()
 user_id = st.session_state.user_id
 
 # Page config
@@ -277,8 +257,8 @@ else:
                                 daily_required = (goal["target"] - new_current) / days_left
                                 on_track = daily_required <= 0 or new_current >= goal["target"]
                             
-                            # Update goal in Firestore
-                            update_goal(db, user_id, goal["id"], {
+                            # Queue the update; get_goals reflects it immediately
+                            get_write_queue().update_goal(user_id, goal["id"], {
                                 "current": new_current,
                                 "on_track": on_track
                             })
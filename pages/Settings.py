@@ -1,8 +1,6 @@
 import streamlit as st
 import sys
 import os
-import firebase_admin 
-from firebase_admin import firestore
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
@@ -13,20 +11,20 @@ from auth_guard import check_auth, get_username
 from firebase_init import init_firestore
 from config import CURRENCY
 from shared_utils import get_categories, update_categories_firestore
+from transaction_repository import invalidate_transactions
+
+# After an account deletion the rerun lands here logged out; show what was purged before check_auth stops the page
+purge_report = st.session_state.pop("purge_report", None)
+if purge_report is not None:
+    st.success("Your account has been permanently deleted.")
+    if purge_report:
+        st.write("Purged: " + ", ".join(f"{name} ({count:,} documents)" for name, count in sorted(purge_report.items())))
 
 # Check authentication
 check_auth()
 
 # Initialize Firebase
-if not firebase_admin._apps:
-    try:
-        cred = firebase_admin.credentials.Certificate("firebase_key.json")
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        st.error(f"Error initializing Firebase: {e}. Please ensure 'firebase_key.json' is correctly placed and valid.")
-        st.stop()
-
-db = firestore.client()
+db = init_firestore()
 
 user_id = st.session_state.user_id
 
@@ -112,11 +110,6 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-# Function to get user transactions (for activity chart)
-def get_user_transactions(uid):
-    tx_ref = db.collection("users").document(uid).collection("transactions").stream()
-    return [tx.to_dict() for tx in tx_ref]
-
 # Create tabs for better organization
 #tabs = st.tabs(["🔒 Account"])
 
@@ -128,13 +121,9 @@ def get_user_transactions(uid):
 #         st.write("View your recent transaction activity over the last 24 hours.")
 
 #     # Fetch recent transactions for the 24-hour activity chart
-#     tx_data = get_user_transactions(user_id)
-#     df = pd.DataFrame(tx_data)
-
-#     if not df.empty and 'date' in df.columns and 'amount' in df.columns:
-#         df['date'] = pd.to_datetime(df['date'], errors='coerce')
-#         df.dropna(subset=['date', 'amount'], inplace=True)
+#     df = get_transactions(db, user_id)
 
+#     if not df.empty:
 #         # Filter for transactions in the last 24 hours
 #         recent_transactions = df[df['date'] >= (datetime.now() - timedelta(days=1))].copy()
 #         if not recent_transactions.empty:
@@ -176,7 +165,7 @@ def get_user_transactions(uid):
 
 #     MAX_CATEGORIES = 20
 
-#     # Get categories directly from Firestore (no caching)
+#     # Get user categories (memoized, updated in place on save)
 #     user_categories = get_categories(db, user_id)
 #     expense_categories = user_categories.get("expense", [])
 #     income_categories = user_categories.get("income", [])
@@ -294,16 +283,29 @@ with st.expander("Delete All Transactions"):
         f"To confirm, type '{confirmation_text}' below:",
         key="delete_confirmation"
     )
+
+    # Optional throttle so very large deletes stay under the project's Firestore write quota
+    throttle_deletes = st.checkbox("Throttle deletion (slower, gentler on write quota)", key="throttle_deletes")
+    max_ops_per_second = None
+    if throttle_deletes:
+        max_ops_per_second = st.slider("Max deletes per second", min_value=50, max_value=1000, value=200, step=50)
     
     if st.button("Delete All Transactions", type="primary", use_container_width=True):
         if user_confirmation == confirmation_text:
             # Use the shared utility function to delete all transactions
             from shared_utils import delete_all_transactions
-            success = delete_all_transactions(db, user_id)
+            progress_bar = st.progress(0.0, text="Deleting transactions...")
+
+            def show_delete_progress(deleted, total):
+                progress_bar.progress(deleted / total if total else 1.0, text=f"Deleted {deleted:,} of {total:,} transactions")
+
+            success = delete_all_transactions(db, user_id, progress_callback=show_delete_progress, max_ops_per_second=max_ops_per_second)
             
             if success:
                 st.success("All transactions have been deleted successfully!")
                 st.balloons()
+            else:
+                st.error("Some transactions could not be deleted. Please try again.")
         else:
             st.error("Confirmation text doesn't match. Transactions were not deleted.")
 
@@ -326,25 +328,24 @@ with st.expander("Delete Account"):
             # Function to delete user account
             def delete_user_account(db, user_id):
                 try:
-                    # 1. Delete all transactions
-                    from shared_utils import delete_all_transactions
-                    delete_all_transactions(db, user_id)
-                    
-                    # 2. Delete user categories
-                    db.collection("users").document(user_id).collection("categories").document("user_categories").delete()
-                    
-                    # 3. Delete user document
-                    db.collection("users").document(user_id).delete()
-                    
+                    # Recursively purge every subcollection (transactions, summaries, goals, budget, ...) and the user document
+                    from shared_utils import delete_user_data
+                    progress_bar = st.progress(0.0, text="Deleting your data...")
+
+                    def show_purge_progress(done, total, name):
+                        progress_bar.progress(done / total, text=f"Deleted '{name}' ({done} of {total} collections)")
+
+                    # Kept for the rerun below, which would wipe anything drawn now
+                    st.session_state.purge_report = delete_user_data(db, user_id, progress_callback=show_purge_progress)
                     return True
                 except Exception as e:
                     st.error(f"Error deleting account: {e}")
                     return False
             
             success = delete_user_account(db, user_id)
+            invalidate_transactions(user_id)  # Also covers a purge that failed part-way
             
             if success:
-                st.success("Your account has been permanently deleted.")
                 st.session_state.update({"logged_in": False})
                 st.rerun()
         else:
@@ -0,0 +1,34 @@
+"""
+Recompute the users/{uid}/summaries/{YYYY-MM} documents from raw transactions.
+
+Summaries are kept up to date on every add and delete; run this after bulk
+changes made outside the app, or to repair drift:
+
+    python rebuild_summaries.py                 # all users, credentials from .streamlit/secrets.toml
+    python rebuild_summaries.py --uid <user_id> # a single user
+    python rebuild_summaries.py --key-file firebase_key.json
+"""
+import argparse
+import logging
+
+from firebase_init import init_firestore_from_key_file
+from shared_utils import rebuild_summaries
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild monthly transaction summaries from raw transactions.")
+    parser.add_argument("--uid", help="Only rebuild this user (default: every user)")
+    parser.add_argument("--key-file", help="Service account JSON (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    db = init_firestore_from_key_file(args.key_file)
+    uids = [args.uid] if args.uid else [doc.id for doc in db.collection("users").list_documents()]
+    for uid in uids:
+        months = rebuild_summaries(db, uid)
+        logging.info(f"{uid}: rebuilt {months} monthly summaries")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,332 @@
 # Shared utilities for WalletGenie app to ensure consistent data access across pages
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def get_categories(db, uid):
-    """Get user categories directly from Firestore without caching"""
-    doc_ref = db.collection("users").document(uid)
-    doc = doc_ref.get()
+from firebase_admin import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+from data_cache import bump_data_version, drop_cached_lookup, get_cached_lookup, update_cached_lookup
+from transaction_repository import (
+    SUMMARY_META_DOC, discard_transactions, expect_transaction_update, forget_transactions, summaries_ref,
+    summary_month_key, transactions_ref,
+)
+
+# Deletes are queued to the BulkWriter and flushed in chunks of this size between progress updates
+DELETE_CHUNK_SIZE = 1000
+MAX_DELETE_ATTEMPTS = 5
+MAX_IMPORT_ATTEMPTS = 5
+# Firestore batches are limited to 500 operations: one per transaction plus one per month touched
+MAX_BATCH_TRANSACTIONS = 200
+
+def _merge_fields(current, updates):
+    """Apply a set(..., merge=True) to a cached copy: nested maps merge, other values replace"""
+    merged = dict(current)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_fields(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def _load_categories(db, uid):
+    doc = db.collection("users").document(uid).get()
     if doc.exists:
         data = doc.to_dict()
         return data.get("categories", {"expense": [], "income": []})
     return {"expense": [], "income": []}
 
+def get_categories(db, uid):
+    """Get user categories (memoized per user, kept current by update_categories_firestore)"""
+    return get_cached_lookup(uid, "categories", lambda: _load_categories(db, uid))
+
 def update_categories_firestore(db, uid, categories_data):
     """Update categories in Firestore"""
     doc_ref = db.collection("users").document(uid)
     doc_ref.set({"categories": categories_data}, merge=True)
+    update_cached_lookup(uid, "categories", lambda categories: _merge_fields(categories, categories_data))
+    bump_data_version(uid)
+
+def add_transactions(db, uid, transactions, tx_ids=None):
+    """Add several transactions and their monthly summary increments in one Firestore transaction; returns their IDs"""
+    if len(transactions) > MAX_BATCH_TRANSACTIONS:
+        raise ValueError(f"At most {MAX_BATCH_TRANSACTIONS} transactions can be added at once")
+    tx_ids = tx_ids or [str(uuid.uuid4()) for _ in transactions]
+    new_transactions = dict(zip(tx_ids, transactions))
+    doc_refs = [transactions_ref(db, uid).document(tx_id) for tx_id in tx_ids]
+
+    @firestore.transactional
+    def _add(transaction):
+        # IDs that already exist were written by an earlier attempt whose commit outcome was lost,
+        # so a retry neither duplicates them nor counts them in the summaries twice
+        month_summaries = {}
+        for snapshot in transaction.get_all(doc_refs):
+            if snapshot.exists:
+                continue
+            tx_data = new_transactions[snapshot.id]
+            transaction.set(snapshot.reference, {**tx_data, "updated_at": firestore.SERVER_TIMESTAMP})
+            _accumulate_summary(month_summaries, tx_data)
+        # One increment write per month instead of one per transaction
+        for month, summary in month_summaries.items():
+            transaction.set(summaries_ref(db, uid).document(month), _as_increments(summary), merge=True)
+
+    expect_transaction_update(uid)
+    _add(db.transaction())
+    bump_data_version(uid)
+    return tx_ids
+
+def delete_transactions(db, uid, tx_ids):
+    """Delete several transactions and decrement their monthly summaries in one Firestore transaction; returns the deleted IDs"""
+    if len(tx_ids) > MAX_BATCH_TRANSACTIONS:
+        raise ValueError(f"At most {MAX_BATCH_TRANSACTIONS} transactions can be deleted at once")
+    doc_refs = [transactions_ref(db, uid).document(tx_id) for tx_id in tx_ids]
 
-def delete_all_transactions(db, uid):
-    """Delete all transactions for a user"""
-    tx_ref = db.collection("users").document(uid).collection("transactions")
+    @firestore.transactional
+    def _delete(transaction):
+        # Read inside the transaction so the decrements match exactly what is deleted
+        month_summaries = {}
+        deleted = []
+        for snapshot in transaction.get_all(doc_refs):
+            if snapshot.exists:
+                transaction.delete(snapshot.reference)
+                _accumulate_summary(month_summaries, snapshot.to_dict())
+                deleted.append(snapshot.id)
+        for month, summary in month_summaries.items():
+            transaction.set(summaries_ref(db, uid).document(month), _as_increments(summary, sign=-1), merge=True)
+        return deleted
+
+    deleted = _delete(db.transaction())
+    bump_data_version(uid)
+    return deleted
+
+def update_transactions(db, uid, updates):
+    """Apply {tx_id: changed fields} as updates and move their summary contributions, in one Firestore transaction"""
+    if len(updates) > MAX_BATCH_TRANSACTIONS:
+        raise ValueError(f"At most {MAX_BATCH_TRANSACTIONS} transactions can be updated at once")
+    doc_refs = [transactions_ref(db, uid).document(tx_id) for tx_id in updates]
+
+    @firestore.transactional
+    def _update(transaction):
+        # Only the changed fields are written; the summaries get one net increment per month touched
+        month_summaries = {}
+        updated = []
+        for snapshot in transaction.get_all(doc_refs):
+            if not snapshot.exists:
+                continue
+            fields = updates[snapshot.id]
+            tx_data = snapshot.to_dict()
+            transaction.update(snapshot.reference, {**fields, "updated_at": firestore.SERVER_TIMESTAMP})
+            _accumulate_summary(month_summaries, tx_data, sign=-1)
+            _accumulate_summary(month_summaries, {**tx_data, **fields})
+            updated.append(snapshot.id)
+        for month, summary in month_summaries.items():
+            transaction.set(summaries_ref(db, uid).document(month), _as_increments(summary), merge=True)
+        return updated
+
+    expect_transaction_update(uid)
+    updated = _update(db.transaction())
+    bump_data_version(uid)
+    return updated
+
+def init_summaries(db, uid):
+    """Mark a new account's (empty) monthly summaries as complete so pages can trust them"""
+    summaries_ref(db, uid).document(SUMMARY_META_DOC).set({"rebuilt_at": firestore.SERVER_TIMESTAMP})
+    bump_data_version(uid)
+    return True
+
+def _accumulate_summary(summaries, tx_data, sign=1):
+    """Fold one transaction into (sign=1) or out of (sign=-1) an in-memory {YYYY-MM: summary} dict"""
+    month = summary_month_key(tx_data.get("date"))
+    if not month:
+        return
+    tx_type = str(tx_data.get("type", "")).lower().strip()
+    category = str(tx_data.get("category", ""))
+    amount = float(tx_data.get("amount") or 0) * sign
+
+    summary = summaries.setdefault(month, {"month": month, "totals": {}, "counts": {}, "categories": {}})
+    summary["totals"][tx_type] = summary["totals"].get(tx_type, 0) + amount
+    summary["counts"][tx_type] = summary["counts"].get(tx_type, 0) + sign
+    cat_totals = summary["categories"].setdefault(tx_type, {}).setdefault(category, {"total": 0, "count": 0})
+    cat_totals["total"] += amount
+    cat_totals["count"] += sign
+
+def _as_increments(values, sign=1):
+    """Turn the numbers in an accumulated summary into firestore.Increment transforms (strings pass through)"""
+    if isinstance(values, dict):
+        return {key: _as_increments(value, sign) for key, value in values.items()}
+    if isinstance(values, (int, float)):
+        return firestore.Increment(values * sign)
+    return values
+
+def rebuild_summaries(db, uid):
+    """Recompute every monthly summary document from the raw transactions"""
+    summaries = {}
+    for doc in transactions_ref(db, uid).stream():
+        _accumulate_summary(summaries, doc.to_dict())
+
+    # Replace the old summary documents; Firestore batches are limited to 500 operations
     batch = db.batch()
-    
-    # Get all transactions
-    docs = tx_ref.stream()
     count = 0
-    
-    # Firestore batches are limited to 500 operations
-    for doc in docs:
-        batch.delete(tx_ref.document(doc.id))
+    for doc in summaries_ref(db, uid).stream():
+        if doc.id != SUMMARY_META_DOC and doc.id not in summaries:
+            batch.delete(doc.reference)
+            count += 1
+            if count >= 450:
+                batch.commit()
+                batch = db.batch()
+                count = 0
+    for month, summary in summaries.items():
+        batch.set(summaries_ref(db, uid).document(month), summary)
         count += 1
-        
-        # If we reach 450 operations, commit the batch and start a new one
         if count >= 450:
             batch.commit()
             batch = db.batch()
             count = 0
-    
-    # Commit any remaining operations
-    if count > 0:
-        batch.commit()
-    
-    return True
+    batch.set(summaries_ref(db, uid).document(SUMMARY_META_DOC), {"rebuilt_at": firestore.SERVER_TIMESTAMP})
+    batch.commit()
+    bump_data_version(uid)
 
-def get_budget(db, uid):
-    """Get user budget data from Firestore"""
+    return len(summaries)
+
+def import_transactions(db, uid, tx_chunks, progress_callback=None):
+    """Bulk-write chunks of transactions and fold each chunk into the monthly summaries.
+
+    tx_chunks is any iterable of lists of transaction dicts, so callers can stream large files.
+    Each chunk is flushed before the next is read, keeping memory bounded; progress_callback
+    receives the running number of imported transactions. Returns (imported, failed): only
+    transactions whose create succeeded are counted and added to the summaries.
+    """
+    bulk_writer = db.bulk_writer()
+    failed_paths = set()
+    summaries_failed = []
+
+    def on_write_error(failure, writer):
+        # Retry transient failures a few times, then give up on that document
+        if failure.attempts < MAX_IMPORT_ATTEMPTS:
+            return True
+        reference = failure.operation.reference
+        if reference.parent.id == summaries_ref(db, uid).id:
+            summaries_failed.append(reference.id)
+        else:
+            failed_paths.add(reference.path)
+        return False
+
+    bulk_writer.on_write_error(on_write_error)
+    expect_transaction_update(uid)
+    imported = 0
+    failed = 0
+    for chunk in tx_chunks:
+        doc_refs = []
+        for tx_data in chunk:
+            doc_ref = transactions_ref(db, uid).document(str(uuid.uuid4()))
+            bulk_writer.create(doc_ref, {**tx_data, "updated_at": firestore.SERVER_TIMESTAMP})
+            doc_refs.append(doc_ref)
+        bulk_writer.flush()
+
+        # Summaries only count the transactions that were actually created, one increment write per month
+        month_summaries = {}
+        for doc_ref, tx_data in zip(doc_refs, chunk):
+            if doc_ref.path in failed_paths:
+                failed += 1
+            else:
+                _accumulate_summary(month_summaries, tx_data)
+                imported += 1
+        for month, summary in month_summaries.items():
+            bulk_writer.set(summaries_ref(db, uid).document(month), _as_increments(summary), merge=True)
+        bulk_writer.flush()
+
+        bump_data_version(uid)
+        if progress_callback:
+            progress_callback(imported)
+    bulk_writer.close()
+    if summaries_failed:
+        # Some months missed their increments; recompute them from the transactions that did land
+        rebuild_summaries(db, uid)
+    return imported, failed
+
+def delete_all_transactions(db, uid, progress_callback=None, max_ops_per_second=None):
+    """Delete all transactions for a user with a BulkWriter, reporting progress as (deleted, total)"""
+    # Drop queued transaction writes first, or the flusher (or a manual retry) would re-add deleted
+    # transactions after the wipe; waits for a flush in progress, whose writes the wipe then covers
+    from write_queue import TRANSACTION_OPS, get_write_queue  # Imported here: write_queue imports this module
+    get_write_queue().discard(uid, ops=TRANSACTION_OPS)
+
+    tx_ref = transactions_ref(db, uid)
+    total = tx_ref.count(alias="count").get()[0][0].value
+
+    # The BulkWriter sends deletes as parallel batches and ramps up traffic (500/50/5);
+    # max_ops_per_second caps it to stay under the project's write quota
+    options = None
+    if max_ops_per_second:
+        options = BulkWriterOptions(initial_ops_per_second=max_ops_per_second, max_ops_per_second=max_ops_per_second)
+    bulk_writer = db.bulk_writer(options=options)
+
+    failed = []
+
+    def on_write_error(failure, writer):
+        # Retry transient failures a few times, then give up on that document
+        if failure.attempts < MAX_DELETE_ATTEMPTS:
+            return True
+        failed.append(failure)
+        return False
+
+    bulk_writer.on_write_error(on_write_error)
+
+    # list_documents() yields references without reading document contents
+    deleted = 0
+    pending = 0
+    for doc_ref in tx_ref.list_documents(page_size=DELETE_CHUNK_SIZE):
+        bulk_writer.delete(doc_ref)
+        pending += 1
+        if pending >= DELETE_CHUNK_SIZE:
+            # Wait for this chunk so progress is reported from the calling (Streamlit) thread
+            bulk_writer.flush()
+            deleted += pending
+            pending = 0
+            if progress_callback:
+                progress_callback(min(deleted, total), total)
+    bulk_writer.close()
+    forget_transactions(uid)
+    if progress_callback:
+        progress_callback(total, total)
+
+    # With no transactions left every monthly summary is zero, so start the summaries over
+    rebuild_summaries(db, uid)
+
+    return not failed
+
+def delete_user_data(db, uid, progress_callback=None, max_workers=4):
+    """Purge every subcollection under users/{uid} concurrently, then the user document.
+
+    Subcollections are discovered at runtime (transactions, summaries, goals, budget, ...) and each is
+    deleted recursively, including any nested subcollections. progress_callback(done, total, name) is
+    called from the calling thread as each collection finishes. Returns {collection name: documents deleted}.
+    """
+    # Drop queued writes first, or the flusher would re-create documents after the purge
+    from write_queue import get_write_queue  # Imported here: write_queue imports this module
+    get_write_queue().discard(uid)
+
+    user_ref = db.collection("users").document(uid)
+    collections = list(user_ref.collections())
+    purged = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(db.recursive_delete, col_ref): col_ref.id for col_ref in collections}
+        for future in as_completed(futures):
+            name = futures[future]
+            purged[name] = future.result()
+            if progress_callback:
+                progress_callback(len(purged), len(collections), name)
+
+    user_ref.delete()
+    logging.info(f"Purged user {uid}: " + ", ".join(f"{name} ({count} documents)" for name, count in sorted(purged.items())))
+    discard_transactions(uid)
+    for name in ("categories", "budget", "goals"):
+        drop_cached_lookup(uid, name)
+    bump_data_version(uid)
+    return purged
+
+def _load_budget(db, uid):
     doc_ref = db.collection("users").document(uid).collection("budget").document("current")
     doc = doc_ref.get()
     if doc.exists:
@@ -51,14 +336,19 @@ def get_budget(db, uid):
         "categories": {}
     }
 
+def get_budget(db, uid):
+    """Get user budget data (memoized per user, kept current by update_budget)"""
+    return get_cached_lookup(uid, "budget", lambda: _load_budget(db, uid))
+
 def update_budget(db, uid, budget_data):
     """Update budget data in Firestore"""
     doc_ref = db.collection("users").document(uid).collection("budget").document("current")
     doc_ref.set(budget_data, merge=True)
+    update_cached_lookup(uid, "budget", lambda budget: _merge_fields(budget, budget_data))
+    bump_data_version(uid)
     return True
 
-def get_goals(db, uid):
-    """Get user financial goals from Firestore"""
+def _load_goals(db, uid):
     goals_ref = db.collection("users").document(uid).collection("goals").stream()
     goals = []
     for doc in goals_ref:
@@ -67,20 +357,30 @@ def get_goals(db, uid):
         goals.append(goal_data)
     return goals
 
+def get_goals(db, uid):
+    """Get user financial goals (memoized per user, kept current by the goal writers below)"""
+    return get_cached_lookup(uid, "goals", lambda: _load_goals(db, uid))
+
 def add_goal(db, uid, goal_data):
     """Add a new financial goal to Firestore"""
     goals_ref = db.collection("users").document(uid).collection("goals")
-    goals_ref.add(goal_data)
+    _, goal_ref = goals_ref.add(goal_data)
+    update_cached_lookup(uid, "goals", lambda goals: goals + [{**goal_data, "id": goal_ref.id}])
+    bump_data_version(uid)
     return True
 
 def update_goal(db, uid, goal_id, goal_data):
     """Update an existing financial goal in Firestore"""
     goal_ref = db.collection("users").document(uid).collection("goals").document(goal_id)
     goal_ref.update(goal_data)
+    update_cached_lookup(uid, "goals", lambda goals: [{**goal, **goal_data} if goal["id"] == goal_id else goal for goal in goals])
+    bump_data_version(uid)
     return True
 
 def delete_goal(db, uid, goal_id):
     """Delete a financial goal from Firestore"""
     goal_ref = db.collection("users").document(uid).collection("goals").document(goal_id)
     goal_ref.delete()
+    update_cached_lookup(uid, "goals", lambda goals: [goal for goal in goals if goal["id"] != goal_id])
+    bump_data_version(uid)
     return True
\ No newline at end of file
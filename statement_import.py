@@ -0,0 +1,131 @@
+# Streaming parser for CSV/XLSX bank statements, mapped onto the transaction schema
+import pandas as pd
+from openpyxl import load_workbook
+
+from transaction_repository import format_tx_date, parse_tx_dates
+
+# Rows are parsed and written this many at a time so memory stays bounded for large files
+IMPORT_CHUNK_SIZE = 5000
+
+# Date formats offered in the import UI (label -> strptime format)
+STATEMENT_DATE_FORMATS = {
+    "YYYY-MM-DD": "%Y-%m-%d",
+    "DD/MM/YYYY": "%d/%m/%Y",
+    "MM/DD/YYYY": "%m/%d/%Y",
+    "DD-MM-YYYY": "%d-%m-%Y",
+    "DD MMM YYYY": "%d %b %Y",
+}
+
+# Statement spellings of the two transaction types
+EXPENSE_TYPE_VALUES = {"expense", "debit", "dr", "withdrawal"}
+INCOME_TYPE_VALUES = {"income", "credit", "cr", "deposit"}
+
+
+def _is_excel(filename):
+    return filename.lower().endswith((".xlsx", ".xlsm"))
+
+
+def _rewind(file):
+    file.seek(0)
+    return file
+
+
+def read_statement_columns(file, filename):
+    """Get the header row of a statement without reading the rest of it"""
+    if _is_excel(filename):
+        workbook = load_workbook(_rewind(file), read_only=True, data_only=True)
+        try:
+            header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [str(col) for col in header if col is not None]
+    return list(pd.read_csv(_rewind(file), nrows=0).columns)
+
+
+def count_statement_rows(file, filename):
+    """Estimate the number of data rows, for progress reporting"""
+    if _is_excel(filename):
+        workbook = load_workbook(_rewind(file), read_only=True, data_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    # Count newlines 1 MB at a time instead of parsing the CSV
+    _rewind(file)
+    lines = 0
+    for block in iter(lambda: file.read(1 << 20), b""):
+        lines += block.count(b"\n")
+    return max(lines - 1, 0)
+
+
+def iter_statement_chunks(file, filename, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield the statement as DataFrames of at most chunk_size rows"""
+    if not _is_excel(filename):
+        # keep_default_na=False keeps blank cells as "" instead of NaN floats
+        yield from pd.read_csv(_rewind(file), chunksize=chunk_size, dtype=str, keep_default_na=False)
+        return
+
+    workbook = load_workbook(_rewind(file), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(col) if col is not None else "" for col in next(rows, ())]
+        buffer = []
+        for row in rows:
+            buffer.append(row[:len(header)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def _parse_amounts(values):
+    """Parse statement amounts like '1,234.50', '₹ 99' or '(12.00)' into floats"""
+    text = values.astype(str).str.strip()
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    cleaned = text.str.replace(r"[^0-9.\-]", "", regex=True)
+    amounts = pd.to_numeric(cleaned, errors="coerce")
+    return amounts.where(~negative, -amounts.abs())
+
+
+def map_statement_chunk(chunk, column_map, date_format, default_category="Others"):
+    """Map one statement chunk onto description/amount/date/type/category dicts.
+
+    column_map maps "date", "description", "amount" and optionally "type" and "category" to
+    statement column names. Without a type column, negative amounts are expenses and positive
+    amounts are income. Returns (transactions, number of skipped rows).
+    """
+    # Excel cells may already be datetimes; text is parsed with the chosen format
+    dates = parse_tx_dates(chunk[column_map["date"]], formats=[date_format])
+    amounts = _parse_amounts(chunk[column_map["amount"]])
+
+    if column_map.get("type"):
+        type_values = chunk[column_map["type"]].astype(str).str.strip().str.lower()
+        types = pd.Series(None, index=chunk.index, dtype="object")
+        types[type_values.isin(EXPENSE_TYPE_VALUES)] = "Expense"
+        types[type_values.isin(INCOME_TYPE_VALUES)] = "Income"
+    else:
+        types = pd.Series("Income", index=chunk.index).where(amounts >= 0, "Expense")
+
+    if column_map.get("category"):
+        categories = chunk[column_map["category"]].fillna("").astype(str).str.strip().replace("", default_category)
+    else:
+        categories = pd.Series(default_category, index=chunk.index)
+    descriptions = chunk[column_map["description"]].fillna("").astype(str).str.strip() if column_map.get("description") else pd.Series("", index=chunk.index)
+
+    valid = dates.notna() & amounts.notna() & (amounts != 0) & types.notna()
+    transactions = [
+        {
+            "description": description,
+            "amount": round(abs(float(amount)), 2),
+            "date": format_tx_date(tx_date),
+            "type": tx_type,
+            "category": category,
+        }
+        for description, amount, tx_date, tx_type, category in zip(
+            descriptions[valid], amounts[valid], dates[valid], types[valid], categories[valid]
+        )
+    ]
+    return transactions, int((~valid).sum())
@@ -0,0 +1,148 @@
+# Tests for the write-behind queue: coalescing of a user's pending writes and isolation of failing rows.
+# The Firestore writers and the listener hooks are replaced by recorders, so no Firebase project is needed.
+import os
+import sys
+import types
+
+import pytest
+
+# Add the root directory to the path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Recorder:
+    """Stand-in for the Firestore writers and listener hooks write_queue calls"""
+
+    def __init__(self):
+        self.calls = []  # (writer name, args) for every write attempted
+        self.settled = []  # (counts, written) for every settle_transactions call
+        self.fail = lambda name, args: False  # Return True to make a write raise
+
+    def writer(self, name):
+        def write(*args):
+            self.calls.append((name, args))
+            if self.fail(name, args):
+                raise RuntimeError(f"{name} rejected")
+        write.__name__ = name
+        return write
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def write_queue(monkeypatch, recorder):
+    """The write_queue module imported against stand-in modules for its Streamlit and Firestore dependencies"""
+    streamlit = types.ModuleType("streamlit")
+    streamlit.cache_resource = lambda **kwargs: (lambda func: func)
+    shared_utils = types.ModuleType("shared_utils")
+    shared_utils.MAX_BATCH_TRANSACTIONS = 500
+    for name in ("add_transactions", "delete_transactions", "update_goal", "update_transactions"):
+        setattr(shared_utils, name, recorder.writer(name))
+    repository = types.ModuleType("transaction_repository")
+    for name in ("amend_transactions", "drop_pending_transactions", "forget_transactions", "remember_transactions"):
+        setattr(repository, name, lambda *args: None)
+    repository.settle_transactions = lambda uid, counts, written=True: recorder.settled.append((dict(counts), written))
+    data_cache = types.ModuleType("data_cache")
+    data_cache.update_cached_lookup = lambda *args: None
+    firebase_init = types.ModuleType("firebase_init")
+    firebase_init.init_firestore = lambda: None
+    for module in (streamlit, shared_utils, repository, data_cache, firebase_init):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    monkeypatch.delitem(sys.modules, "write_queue", raising=False)
+    import write_queue
+    # Retry failed rows on the very next flush
+    monkeypatch.setattr(write_queue, "RETRY_BASE_SECONDS", 0)
+    return write_queue
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path, write_queue):
+    """A queue whose flushes are driven by the test instead of the background thread"""
+    monkeypatch.setattr(write_queue.threading, "Thread", lambda **kwargs: types.SimpleNamespace(start=lambda: None))
+    return write_queue.WriteQueue(db="db", path=str(tmp_path / "queue.sqlite3"))
+
+
+def test_flush_coalesces_a_users_writes(queue, recorder):
+    kept, dropped = queue.add_transactions("u1", [{"description": "kept", "amount": 1}, {"description": "dropped", "amount": 2}])
+    queue.update_transactions("u1", {kept: {"amount": 5}})
+    queue.delete_transactions("u1", [dropped])
+    queue.update_transactions("u1", {"old": {"category": "Food"}})
+    queue.update_transactions("u1", {"old": {"amount": 3}})
+    queue.delete_transactions("u1", ["gone"])
+    queue.update_goal("u1", "goal", {"saved": 10})
+    queue.update_goal("u1", "goal", {"target": 20})
+
+    queue._flush_due()
+
+    # One write per kind: the edit folded into its add, the added-then-deleted transaction never written
+    assert recorder.calls == [
+        ("add_transactions", ("db", "u1", [{"description": "kept", "amount": 5}], [kept])),
+        ("update_transactions", ("db", "u1", {"old": {"category": "Food", "amount": 3}})),
+        ("delete_transactions", ("db", "u1", ["gone"])),
+        ("update_goal", ("db", "u1", "goal", {"saved": 10, "target": 20})),
+    ]
+    assert ({dropped: 2}, False) in recorder.settled
+    assert queue.status("u1") == (0, 0)
+
+
+def test_flush_keeps_users_apart(queue, recorder):
+    queue.delete_transactions("u1", ["a"])
+    queue.delete_transactions("u2", ["b"])
+    recorder.fail = lambda name, args: args[1] == "u1"
+
+    queue._flush_due()
+
+    assert queue.status("u1") == (1, 0)
+    assert queue.status("u2") == (0, 0)
+
+
+def test_failing_row_is_isolated_from_its_chunk(queue, recorder, write_queue):
+    transactions = [{"description": f"tx {i}", "amount": i} for i in range(8)]
+    transactions[5]["description"] = "bad"
+    queue.add_transactions("u1", transactions)
+    recorder.fail = lambda name, args: any(tx["description"] == "bad" for tx in args[2])
+
+    chunk_sizes = []
+    for _ in range(3):
+        start = len(recorder.calls)
+        queue._flush_due()
+        chunk_sizes.append([len(args[2]) for _, args in recorder.calls[start:]])
+
+    # The failing chunk is split on every attempt, so the good rows are written within three flushes
+    assert chunk_sizes == [[8], [4, 4], [1, 1, 1, 1]]
+    written = [tx for _, args in recorder.calls[1:] if not recorder.fail("add_transactions", args) for tx in args[2]]
+    assert sorted(tx["amount"] for tx in written) == [0, 1, 2, 3, 4, 6, 7]
+    assert queue.status("u1") == (1, 0)
+
+    # The bad row alone keeps failing until it is marked failed and kept for a manual retry
+    for _ in range(write_queue.MAX_WRITE_ATTEMPTS):
+        queue._flush_due()
+    assert queue.status("u1") == (0, 1)
+
+
+def test_delete_cancels_an_add_that_gave_up(queue, recorder, write_queue):
+    [tx_id] = queue.add_transactions("u1", [{"description": "bad", "amount": 1}])
+    recorder.fail = lambda name, args: name == "add_transactions"
+    for _ in range(write_queue.MAX_WRITE_ATTEMPTS):
+        queue._flush_due()
+    assert queue.status("u1") == (0, 1)
+
+    queue.delete_transactions("u1", [tx_id])
+    queue._flush_due()
+
+    # Neither the add nor the delete of a transaction that never reached Firestore is written
+    assert not any(name == "delete_transactions" for name, _ in recorder.calls)
+    assert queue.status("u1") == (0, 0)
+
+
+def test_discard_can_keep_goal_updates(queue, recorder, write_queue):
+    queue.add_transactions("u1", [{"description": "queued", "amount": 1}])
+    queue.update_goal("u1", "goal", {"saved": 10})
+
+    queue.discard("u1", ops=write_queue.TRANSACTION_OPS)
+    queue._flush_due()
+
+    assert [name for name, _ in recorder.calls] == ["update_goal"]
@@ -0,0 +1,79 @@
+# Chunked CSV / Parquet / XLSX export of transactions with a clean, stable schema
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+from transaction_repository import from_minor_units
+
+# Exported columns, in order; helper columns like amount_display never leave the app
+EXPORT_COLUMNS = ["date", "description", "category", "type", "amount"]
+
+EXPORT_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("description", pa.string()),
+    ("category", pa.string()),
+    ("type", pa.string()),
+    ("amount", pa.float64()),
+])
+
+# Label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel (XLSX)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def to_export_frame(df):
+    """Project a normalized transaction DataFrame onto the export schema"""
+    export_df = df[["date", "description", "category", "type"]].copy()
+    export_df["date"] = export_df["date"].dt.date
+    export_df["category"] = export_df["category"].astype(str)
+    export_df["type"] = export_df["type"].astype(str).str.capitalize()
+    export_df["amount"] = from_minor_units(df["amount_minor"]).astype(float)
+    return export_df[EXPORT_COLUMNS]
+
+
+def _write_csv(chunks, buffer):
+    text = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(text, index=False, header=header)
+        header = False
+    if header:  # No rows: still write the header
+        text.write(",".join(EXPORT_COLUMNS) + "\n")
+    text.flush()
+    text.detach()  # Keep the underlying buffer open
+
+
+def _write_parquet(chunks, buffer):
+    # Each chunk becomes one row group, so only one chunk is converted at a time
+    with pq.ParquetWriter(buffer, EXPORT_SCHEMA) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=EXPORT_SCHEMA, preserve_index=False))
+
+
+def _write_xlsx(chunks, buffer):
+    # write_only workbooks stream rows instead of building the whole sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Transactions")
+    sheet.append(EXPORT_COLUMNS)
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(buffer)
+
+
+def export_transactions(chunks, export_format):
+    """Write normalized transaction chunks to an in-memory file in the given EXPORT_FORMATS format.
+
+    Returns the BytesIO itself, rewound, rather than a bytes copy of it.
+    """
+    export_chunks = (to_export_frame(chunk) for chunk in chunks)
+    buffer = io.BytesIO()
+    writers = {"CSV": _write_csv, "Parquet": _write_parquet, "Excel (XLSX)": _write_xlsx}
+    writers[export_format](export_chunks, buffer)
+    buffer.seek(0)
+    return buffer
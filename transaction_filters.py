@@ -0,0 +1,93 @@
+# In-memory filter engine for WalletGenie.
+# get_transactions returns rows sorted by date descending, so a date range is a contiguous run of row
+# positions found by binary search. Each type and category value also gets a sorted array of its row
+# positions, built once per data version; a filter combination is then an intersection of those arrays
+# cut to the date run. Results are memoized per filter tuple, so going back to an earlier combination
+# or changing one filter at a time doesn't rescan the DataFrame. The engine lives with the user's
+# transaction listener and is dropped when the listener is closed.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_cache import get_data_version
+from transaction_repository import get_derived_state, get_transactions
+
+# Filter combinations remembered per user
+FILTER_CACHE_ENTRIES = 64
+
+
+class TransactionFilter:
+    """Position indexes over one version of a user's normalized transactions"""
+
+    def __init__(self, df, data_version=None):
+        self.data_version = data_version
+        self.df = df
+        # Dates negated so the descending date order becomes ascending for searchsorted
+        self._neg_dates = -df["date"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        self._by_type = {str(k): v for k, v in df.groupby("type", observed=True).indices.items()}
+        self._by_category = {str(k): v for k, v in df.groupby("category", observed=True).indices.items()}
+        self._results = OrderedDict()
+
+    def _date_run(self, start_date, end_date):
+        """[lo, hi) row positions whose date is within start_date..end_date (inclusive days)"""
+        lo, hi = 0, len(self._neg_dates)
+        if end_date:
+            end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            lo = int(np.searchsorted(self._neg_dates, -end.value, side="right"))
+        if start_date:
+            hi = int(np.searchsorted(self._neg_dates, -pd.Timestamp(start_date).value, side="right"))
+        return lo, max(lo, hi)
+
+    def positions(self, tx_type=None, category=None, start_date=None, end_date=None):
+        """Sorted row positions matching the filters (same meaning as build_transactions_query)"""
+        key = (tx_type.lower() if tx_type else None, category, start_date, end_date)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        lo, hi = self._date_run(start_date, end_date)
+        index_sets = []
+        if key[0]:
+            index_sets.append(self._by_type.get(key[0], np.empty(0, dtype=np.intp)))
+        if category:
+            index_sets.append(self._by_category.get(category, np.empty(0, dtype=np.intp)))
+        if index_sets:
+            # Intersect the smallest sets first, then cut the result to the date run
+            index_sets.sort(key=len)
+            matched = index_sets[0]
+            for other in index_sets[1:]:
+                matched = np.intersect1d(matched, other, assume_unique=True)
+            matched = matched[np.searchsorted(matched, lo):np.searchsorted(matched, hi)]
+        else:
+            matched = np.arange(lo, hi)
+        self._results[key] = matched
+        if len(self._results) > FILTER_CACHE_ENTRIES:
+            self._results.popitem(last=False)
+        return matched
+
+    def select(self, tx_type=None, category=None, start_date=None, end_date=None):
+        """Matching rows, still sorted by date descending"""
+        return self.df.iloc[self.positions(tx_type, category, start_date, end_date)]
+
+
+@st.cache_resource(show_spinner=False)
+def _filter_lock():
+    """Process-wide lock around every user's TransactionFilter, shared by every session"""
+    return threading.Lock()
+
+
+def filter_transactions(db, uid, tx_type=None, category=None, start_date=None, end_date=None):
+    """The user's transactions matching the History filters, from indexes rebuilt once per data version"""
+    lock = _filter_lock()
+    state = get_derived_state(db, uid)
+    data_version = get_data_version(uid)
+    with lock:
+        engine = state.get("transaction_filter")
+    if engine is None or engine.data_version != data_version:
+        engine = TransactionFilter(get_transactions(db, uid), data_version)
+        with lock:
+            state["transaction_filter"] = engine
+    with lock:
+        return engine.select(tx_type, category, start_date, end_date)
@@ -0,0 +1,656 @@
+# Transaction repository for WalletGenie: the single place pages read transactions from
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud.firestore_v1.query import Query
+
+from data_cache import CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, bump_data_version, get_data_version, set_data_watched
+from transaction_snapshot import delete_snapshot, load_snapshot, save_snapshot
+
+# Fields read from each Firestore transaction document
+STORED_FIELDS = ["id", "description", "amount", "date", "type", "category"]
+MINOR_UNITS = 100  # paise per rupee
+
+# Transactions store their date as an ISO string so Firestore can sort and range-query it
+DATE_FORMAT = "%Y-%m-%d"
+# Format written by older versions of the Add Transaction page
+LEGACY_DATE_FORMAT = "%m/%d/%Y"
+# Shape of each stored date string format; parse_tx_dates only tries the formats actually present
+DATE_FORMAT_PATTERNS = {
+    DATE_FORMAT: r"\d{4}-\d{2}-\d{2}",
+    LEGACY_DATE_FORMAT: r"\d{1,2}/\d{1,2}/\d{4}",
+}
+
+# Seconds to wait for a listener's first snapshot before falling back to a one-off read
+LISTENER_READY_TIMEOUT = 5
+# Seconds a read waits for the listener to deliver a write made by this process
+LISTENER_WRITE_TIMEOUT = 2
+# Listeners nobody has read for this long are closed
+LISTENER_IDLE_SECONDS = 30 * 60
+# How often a listener writes its on-disk snapshot and checks for deletes it can't see
+SNAPSHOT_SAVE_SECONDS = 60
+RECONCILE_SECONDS = 60
+
+# Marker document in users/{uid}/summaries written by rebuild_summaries; month documents are keyed YYYY-MM
+SUMMARY_META_DOC = "_meta"
+
+
+def format_tx_date(value):
+    """Format a date/datetime as the stored ISO transaction date string"""
+    return value.strftime(DATE_FORMAT)
+
+
+def to_iso_date(value):
+    """Convert a stored date value (legacy string, ISO string or timestamp) to ISO, or None if unparseable"""
+    if isinstance(value, (datetime, date)):
+        return format_tx_date(value)
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    for fmt in (DATE_FORMAT, LEGACY_DATE_FORMAT):
+        try:
+            return format_tx_date(datetime.strptime(value, fmt))
+        except ValueError:
+            continue
+    return None
+
+
+def month_bounds(year, month):
+    """Get the first and last calendar day of a month"""
+    first_day = date(year, month, 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return first_day, date.fromordinal(next_month.toordinal() - 1)
+
+
+def summary_month_key(value):
+    """Get the YYYY-MM summary document ID for a stored transaction date, or None if unparseable"""
+    iso_date = to_iso_date(value)
+    return iso_date[:7] if iso_date else None
+
+
+def transactions_ref(db, uid):
+    """Get the transactions subcollection reference for a user"""
+    return db.collection("users").document(uid).collection("transactions")
+
+
+def summaries_ref(db, uid):
+    """Get the monthly summaries subcollection reference for a user"""
+    return db.collection("users").document(uid).collection("summaries")
+
+
+def to_minor_units(amounts):
+    """Convert rupee amounts (a Series) to int64 paise"""
+    return (amounts * MINOR_UNITS).round().astype("int64")
+
+
+def from_minor_units(amounts_minor):
+    """Convert paise (a Series or number) back to rupees for display and models"""
+    return amounts_minor / MINOR_UNITS
+
+
+def apply_transaction_dtypes(df):
+    """Restore the canonical dtypes, e.g. after pd.concat of frames with different categories"""
+    return df.astype({"date": "datetime64[ns]", "type": "category", "category": "category"})
+
+
+def parse_tx_dates(values, formats=None):
+    """Parse stored dates with one explicit-format, vectorized pass per format present.
+
+    Strings are grouped by the pattern of each candidate format (DATE_FORMAT_PATTERNS by default,
+    or just try each of formats in order); date/datetime/Timestamp values are converted directly.
+    Anything else (numbers included) is unparseable. Returns a datetime64[ns] Series with NaT
+    wherever nothing matched.
+    """
+    values = pd.Series(values)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    is_text = values.map(lambda value: isinstance(value, str)).astype(bool)
+
+    text = values[is_text].astype(str).str.strip()
+    pending = pd.Series(True, index=text.index)
+    patterns = DATE_FORMAT_PATTERNS if formats is None else dict.fromkeys(formats)
+    for fmt, pattern in patterns.items():
+        group = pending & text.str.fullmatch(pattern) if pattern else pending
+        if group.any():
+            dates = pd.to_datetime(text[group], format=fmt, errors="coerce")
+            parsed.loc[dates.index] = dates
+            pending &= parsed.loc[text.index].isna()
+
+    # Firestore timestamps and Excel date cells; timezone-aware values are taken as UTC. Numbers are
+    # left as NaT: to_datetime would read them as epoch nanoseconds (an Excel serial becomes 1970-01-01)
+    is_date = values.map(lambda value: isinstance(value, (date, np.datetime64))).astype(bool)
+    others = values[is_date & values.notna()]
+    if not others.empty:
+        dates = pd.to_datetime(others, errors="coerce", utc=True).dt.tz_localize(None)
+        parsed.loc[dates.index] = dates
+    return parsed
+
+
+def to_stored_records(df):
+    """Turn normalized rows back into Firestore-shaped dicts (rupee amounts, ISO date strings)"""
+    return [
+        {"id": tx_id, "description": description, "amount": amount_minor / MINOR_UNITS,
+         "date": format_tx_date(tx_date), "type": tx_type, "category": category}
+        for tx_id, description, amount_minor, tx_date, tx_type, category in zip(
+            df["id"], df["description"], df["amount_minor"], df["date"], df["type"], df["category"]
+        )
+    ]
+
+
+def apply_transaction_updates(df, updates):
+    """Overlay {tx_id: changed fields} (in stored form) on a normalized DataFrame"""
+    changed = df["id"].isin(updates)
+    if not changed.any():
+        return df
+    records = [{**record, **updates[record["id"]]} for record in to_stored_records(df[changed])]
+    patched = apply_transaction_dtypes(pd.concat([df[~changed], normalize_transactions(records)], ignore_index=True))
+    return patched.sort_values("date", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def normalize_transactions(records):
+    """Build a transaction DataFrame in the canonical schema from raw Firestore dicts.
+
+    Columns are id, description, amount_minor, date, type and category. Amounts are int64 minor
+    units (paise) so sums are exact, type and category are categoricals, date is datetime64.
+    """
+    df = pd.DataFrame(records)
+    for col in STORED_FIELDS:
+        if col not in df.columns:
+            df[col] = pd.Series(dtype="object")
+
+    amounts = pd.to_numeric(df["amount"], errors="coerce")
+    dates = parse_tx_dates(df["date"])
+    valid = amounts.notna() & dates.notna()
+    if not valid.all():
+        # Rows with an unreadable date or amount can't be shown; say which instead of dropping them silently
+        rejected = df.loc[~valid, "id"].tolist()
+        logging.warning(f"Skipped {len(rejected)} transactions with an unreadable date or amount: {rejected[:20]}")
+    df = df[valid]
+
+    df = pd.DataFrame({
+        "id": df["id"],
+        "description": df["description"].fillna("").astype(str),
+        "amount_minor": to_minor_units(amounts[valid]),
+        "date": dates[valid],
+        "type": df["type"].astype(str).str.lower().str.strip(),  # make sure type is lowercase for comparison
+        "category": df["category"].astype(str),
+    })
+    df = apply_transaction_dtypes(df)
+    return df.sort_values("date", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _type_values(tx_type):
+    """Stored spellings of a transaction type ('Expense' from the form, 'expense' from older data)"""
+    return [tx_type.capitalize(), tx_type.lower()]
+
+
+def build_transactions_query(db, uid, tx_type=None, category=None, start_date=None, end_date=None):
+    """Build a server-side filtered query (see firestore.indexes.json for the backing indexes)"""
+    query = transactions_ref(db, uid)
+    if tx_type:
+        query = query.where(filter=FieldFilter("type", "in", _type_values(tx_type)))
+    if category:
+        query = query.where(filter=FieldFilter("category", "==", category))
+    if start_date:
+        query = query.where(filter=FieldFilter("date", ">=", format_tx_date(start_date)))
+    if end_date:
+        query = query.where(filter=FieldFilter("date", "<=", format_tx_date(end_date)))
+    return query
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _query_transactions(_db, uid, data_version, tx_type, category, start_date, end_date):
+    """Fetch only the documents matching the filters and normalize them (emulator fallback for aggregations)"""
+    records = []
+    for doc in build_transactions_query(_db, uid, tx_type, category, start_date, end_date).stream():
+        tx_data = doc.to_dict()
+        tx_data["id"] = doc.id
+        records.append(tx_data)
+    return normalize_transactions(records)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _aggregate_transactions(_db, uid, data_version, tx_type, category, start_date, end_date):
+    """Count and sum matching transactions with one aggregation RPC instead of reading every document"""
+    query = build_transactions_query(_db, uid, tx_type, category, start_date, end_date)
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # The emulator doesn't reliably support sum() aggregations, so compute client-side there
+        df = _query_transactions(_db, uid, data_version, tx_type, category, start_date, end_date)
+        return len(df), float(from_minor_units(df["amount_minor"].sum()))
+
+    results = query.count(alias="count").sum("amount", alias="total").get()
+    values = {result.alias: result.value for result in results[0]}
+    return int(values.get("count") or 0), float(values.get("total") or 0.0)
+
+
+def aggregate_transactions(db, uid, tx_type=None, category=None, start_date=None, end_date=None):
+    """Get (count, total amount) of transactions matching type/category/date-range filters"""
+    return _aggregate_transactions(db, uid, get_data_version(uid), tx_type, category, start_date, end_date)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _fetch_transactions_page(_db, uid, data_version, page_size, cursor, tx_type, category, start_date, end_date):
+    """Fetch one page of newest-first matching transactions starting after a (date, doc ID) cursor"""
+    query = (
+        build_transactions_query(_db, uid, tx_type, category, start_date, end_date)
+        .order_by("date", direction=Query.DESCENDING)
+        .order_by(FieldPath.document_id(), direction=Query.DESCENDING)  # Tie-breaker keeps cursors stable
+    )
+    if cursor:
+        query = query.start_after({"date": cursor[0], FieldPath.document_id(): cursor[1]})
+
+    # Read one extra document to know whether another page exists
+    docs = list(query.limit(page_size + 1).stream())
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+
+    records = []
+    for doc in docs:
+        tx_data = doc.to_dict()
+        tx_data["id"] = doc.id
+        records.append(tx_data)
+    next_cursor = (docs[-1].get("date"), docs[-1].id) if has_more else None
+    return normalize_transactions(records), next_cursor
+
+
+def get_transactions_page(db, uid, page_size, cursor=None, tx_type=None, category=None, start_date=None, end_date=None):
+    """Get one page of matching transactions plus the cursor for the next page (None on the last page)"""
+    return _fetch_transactions_page(db, uid, get_data_version(uid), page_size, cursor, tx_type, category, start_date, end_date)
+
+
+def iter_transaction_chunks(db, uid, chunk_size=5000, tx_type=None, category=None, start_date=None, end_date=None):
+    """Stream matching transactions newest-first as normalized DataFrames of at most chunk_size rows"""
+    query = (
+        build_transactions_query(db, uid, tx_type, category, start_date, end_date)
+        .order_by("date", direction=Query.DESCENDING)
+        .order_by(FieldPath.document_id(), direction=Query.DESCENDING)
+    )
+    records = []
+    for doc in query.stream():
+        tx_data = doc.to_dict()
+        tx_data["id"] = doc.id
+        records.append(tx_data)
+        if len(records) >= chunk_size:
+            yield normalize_transactions(records)
+            records = []
+    if records:
+        yield normalize_transactions(records)
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _load_transactions(_db, uid, data_version):
+    """Stream the user's transactions subcollection once and normalize it (used if the listener isn't ready)"""
+    records = []
+    for doc in transactions_ref(_db, uid).stream():
+        tx_data = doc.to_dict()
+        tx_data["id"] = doc.id  # Keep the document ID for delete/edit
+        records.append(tx_data)
+    return normalize_transactions(records)
+
+
+class TransactionListener:
+    """One user's transactions kept in memory and updated by a Firestore on_snapshot listener.
+
+    The listener starts from the user's on-disk snapshot, if there is one, and only watches
+    documents written since its watermark, so a restart doesn't re-download every transaction.
+    Changes pushed by Firestore are kept in an overlay on top of that base. Deletes of older
+    documents, which such a listener never sees, are found by comparing document counts. Writes
+    still waiting in the write queue are shown from a separate pending layer that is neither
+    counted nor saved until the queue reports them written. The normalized DataFrame is rebuilt
+    lazily, at most once per change, and saved back to disk every SNAPSHOT_SAVE_SECONDS.
+    """
+
+    def __init__(self, db, uid):
+        self.db = db
+        self.uid = uid
+        self.version = 0  # Bumped on every applied change
+        self.last_used = time.monotonic()
+        base, watermark = load_snapshot(uid)
+        self._base = base if base is not None else normalize_transactions([])
+        self._docs = {}  # Documents pushed by the listener (or fetched by _reconcile), by ID
+        self._removed = set()  # IDs deleted since the base was loaded
+        self._pending_docs = {}  # Queued adds and edits from this process, by ID
+        self._pending_removed = set()  # Queued deletes from this process
+        self._pending_counts = {}  # tx_id -> queued writes not yet written or cancelled
+        self._read_time = None  # Firestore read time of the last applied snapshot
+        self._df = None
+        self._df_version = -1
+        self._confirmed_version = 0  # Bumped when the base/overlay (what gets saved) changes
+        self._saved_version = 0
+        self._saved_at = 0.0
+        self._reconcile_at = 0.0  # When to next check for missed deletes (0: on the next read)
+        self._expected_version = 0  # Set by expect_update() before a local write
+        self._changed = threading.Condition()
+        # Structures other modules derive from these transactions (search index, filter engine); they
+        # are dropped along with the listener when it goes idle or the account is deleted
+        self.derived = {}
+        self._resumed = watermark is not None
+
+        query = transactions_ref(db, uid)
+        if watermark is not None:
+            # Written by this app since the snapshot was saved (every writer sets updated_at)
+            query = query.where(filter=FieldFilter("updated_at", ">=", watermark))
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        # Runs on the listener's background thread
+        with self._changed:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self._docs.pop(doc.id, None)
+                    self._removed.add(doc.id)
+                else:
+                    tx_data = doc.to_dict()
+                    tx_data["id"] = doc.id
+                    self._docs[doc.id] = tx_data
+                    self._removed.discard(doc.id)
+            first = self._read_time is None
+            self._read_time = read_time
+            self.version += 1
+            self._confirmed_version += 1
+            self._changed.notify_all()
+
+    def drop_pending(self):
+        """Forget every queued write shown from the pending layer (the queue dropped them unwritten)"""
+        with self._changed:
+            self._pending_docs.clear()
+            self._pending_removed.clear()
+            self._pending_counts.clear()
+            self.version += 1
+            self._changed.notify_all()
+        if first:
+            # From here on this listener reports changes made elsewhere
+            set_data_watched(self.uid, True)
+        if not first or (self._resumed and changes):
+            # Changes made elsewhere (another process, device or CLI job) also invalidate this user's
+            # cached queries; a listener resuming from disk gets those as its first snapshot
+            bump_data_version(self.uid)
+
+    def _reconcile(self):
+        """Drop documents deleted outside the watermark window and fetch any the listener never saw"""
+        tx_ref = transactions_ref(self.db, self.uid)
+        server_count = tx_ref.count(alias="count").get()[0][0].value
+        with self._changed:
+            known = set(self._base["id"]).union(self._docs) - self._removed
+        if server_count == len(known):
+            return
+
+        server_ids = {doc_ref.id for doc_ref in tx_ref.list_documents()}
+        missing = [tx_ref.document(tx_id) for tx_id in server_ids - known]
+        fetched = [doc for doc in self.db.get_all(missing) if doc.exists] if missing else []
+        with self._changed:
+            for doc in fetched:
+                # The listener may have delivered a newer copy in the meantime
+                self._docs.setdefault(doc.id, {**doc.to_dict(), "id": doc.id})
+            for tx_id in known - server_ids:
+                self._docs.pop(tx_id, None)
+                self._removed.add(tx_id)
+            self.version += 1
+            self._confirmed_version += 1
+            self._changed.notify_all()
+        bump_data_version(self.uid)
+
+    def _build_dataframe(self, pending=True):
+        """Merge the listener's overlay (and, with pending, queued writes) into the base snapshot (caller holds the lock)"""
+        docs = {**self._docs, **self._pending_docs} if pending else self._docs
+        hidden = self._removed.union(docs)
+        if pending:
+            hidden |= self._pending_removed
+        df = self._base[~self._base["id"].isin(hidden)] if hidden else self._base
+        if docs:
+            df = apply_transaction_dtypes(pd.concat([df, normalize_transactions(list(docs.values()))], ignore_index=True))
+        return df.sort_values("date", ascending=False, kind="stable").reset_index(drop=True)
+
+    def _save(self, df, version, read_time):
+        """Write the confirmed snapshot to disk and fold the overlay into the base if nothing changed meanwhile"""
+        save_snapshot(self.uid, df, read_time)
+        with self._changed:
+            self._saved_version = version
+            self._saved_at = time.monotonic()
+            if self._confirmed_version == version:
+                self._base, self._docs, self._removed = df, {}, set()
+
+    def expect_update(self):
+        """Called before this process writes, so the next read waits briefly for the listener to deliver it"""
+        with self._changed:
+            self._expected_version = self.version + 1
+
+    def _count_pending(self, tx_ids):
+        for tx_id in tx_ids:
+            self._pending_counts[tx_id] = self._pending_counts.get(tx_id, 0) + 1
+
+    def remember(self, docs):
+        """Show adds queued by this process right away, until the queue settles them"""
+        with self._changed:
+            for tx_id, tx_data in docs.items():
+                self._pending_docs[tx_id] = {**tx_data, "id": tx_id}
+                self._pending_removed.discard(tx_id)
+            self._count_pending(docs)
+            self.version += 1
+            self._changed.notify_all()
+
+    def amend(self, updates):
+        """Show field updates {tx_id: fields} queued by this process right away, until the queue settles them"""
+        with self._changed:
+            unseen = updates.keys() - self._pending_docs.keys() - self._docs.keys() - self._removed
+            for record in to_stored_records(self._base[self._base["id"].isin(unseen)]):
+                self._pending_docs[record["id"]] = record
+            for tx_id, fields in updates.items():
+                current = self._pending_docs.get(tx_id) or self._docs.get(tx_id)
+                if current is not None and tx_id not in self._pending_removed:
+                    self._pending_docs[tx_id] = {**current, **fields}
+            self._count_pending(updates)
+            self.version += 1
+            self._changed.notify_all()
+
+    def forget(self, tx_ids=None):
+        """Hide deletes queued by this process right away; with no IDs, check for deletes on the next read"""
+        with self._changed:
+            if tx_ids is None:
+                self._reconcile_at = 0.0
+                return
+            for tx_id in tx_ids:
+                self._pending_docs.pop(tx_id, None)
+                self._pending_removed.add(tx_id)
+            self._count_pending(tx_ids)
+            self.version += 1
+            self._changed.notify_all()
+
+    def settle(self, counts, written):
+        """The queue finished {tx_id: number of queued writes}; once none are left, written ones join the confirmed overlay"""
+        with self._changed:
+            for tx_id, count in counts.items():
+                left = self._pending_counts.get(tx_id, 0) - count
+                if left > 0:
+                    self._pending_counts[tx_id] = left
+                    continue
+                self._pending_counts.pop(tx_id, None)
+                if tx_id in self._pending_removed:
+                    self._pending_removed.discard(tx_id)
+                    if written:
+                        self._docs.pop(tx_id, None)
+                        self._removed.add(tx_id)
+                elif tx_id in self._pending_docs:
+                    record = self._pending_docs.pop(tx_id)
+                    if written:
+                        # Every queued write for it landed, so the record now matches Firestore
+                        self._docs[tx_id] = record
+                        self._removed.discard(tx_id)
+            self.version += 1
+            self._confirmed_version += 1
+            self._changed.notify_all()
+
+    def to_dataframe(self):
+        """Get the current snapshot as a normalized DataFrame, or None if the first snapshot hasn't arrived"""
+        self.last_used = time.monotonic()
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._read_time is not None, timeout=LISTENER_READY_TIMEOUT):
+                return None
+        if time.monotonic() >= self._reconcile_at:
+            self._reconcile_at = time.monotonic() + RECONCILE_SECONDS
+            try:
+                self._reconcile()
+            except Exception as e:
+                logging.warning(f"Could not check {self.uid}'s transactions for deletes: {e}")
+
+        with self._changed:
+            if self._expected_version:
+                self._changed.wait_for(lambda: self.version >= self._expected_version, timeout=LISTENER_WRITE_TIMEOUT)
+                self._expected_version = 0
+            if self._df_version != self.version:
+                self._df = self._build_dataframe()
+                self._df_version = self.version
+            df, read_time = self._df, self._read_time
+            confirmed_version = self._confirmed_version
+            save_due = confirmed_version != self._saved_version and time.monotonic() - self._saved_at >= SNAPSHOT_SAVE_SECONDS
+            if save_due and read_time is not None:
+                # Queued writes stay out of the file until they are written
+                confirmed = self._build_dataframe(pending=False) if self._pending_docs or self._pending_removed else df
+
+        if save_due and read_time is not None:
+            try:
+                self._save(confirmed, confirmed_version, read_time)
+            except Exception as e:
+                logging.warning(f"Could not save {self.uid}'s transaction snapshot: {e}")
+        # Pages add helper columns, so hand out a copy
+        return df.copy()
+
+    def close(self):
+        self._watch.unsubscribe()
+        set_data_watched(self.uid, False)
+
+
+@st.cache_resource(show_spinner=False)
+def _listener_registry():
+    """Process-wide {uid: TransactionListener}, shared by every session"""
+    return {"lock": threading.Lock(), "listeners": {}}
+
+
+def _get_listener(db, uid):
+    """Get (or start) the user's listener, closing listeners nobody has read for a while"""
+    registry = _listener_registry()
+    with registry["lock"]:
+        listeners = registry["listeners"]
+        now = time.monotonic()
+        for idle_uid in [key for key, listener in listeners.items() if now - listener.last_used > LISTENER_IDLE_SECONDS]:
+            listeners.pop(idle_uid).close()
+        if uid not in listeners:
+            listeners[uid] = TransactionListener(db, uid)
+        return listeners[uid]
+
+
+def get_derived_state(db, uid):
+    """Per-user dict for structures derived from get_transactions, kept only as long as the user's listener"""
+    return _get_listener(db, uid).derived
+
+
+def get_transactions(db, uid):
+    """Get all transactions for a user as a normalized DataFrame, kept fresh by a real-time listener"""
+    df = _get_listener(db, uid).to_dataframe()
+    if df is None:
+        # The listener hasn't delivered its first snapshot yet; fall back to a one-off read
+        return _load_transactions(db, uid, get_data_version(uid))
+    return df
+
+
+def build_transaction_cube(df):
+    """Totals per (day, type, category): columns date, type, category, amount_minor (sum) and count"""
+    cube = df.groupby([df["date"].dt.normalize(), "type", "category"], observed=True)["amount_minor"].agg(["sum", "size"])
+    return cube.rename(columns={"sum": "amount_minor", "size": "count"}).reset_index()
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _load_transaction_cube(_db, uid, data_version):
+    return build_transaction_cube(get_transactions(_db, uid))
+
+
+def get_transaction_cube(db, uid):
+    """Get the user's day x type x category totals, computed once per data version (charts size with days and categories, not rows)"""
+    return _load_transaction_cube(db, uid, get_data_version(uid))
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _load_summaries(_db, uid, data_version):
+    """Read every monthly summary document for a user (one document per month)"""
+    docs = {doc.id: doc.to_dict() for doc in summaries_ref(_db, uid).stream()}
+    if SUMMARY_META_DOC not in docs:
+        return None
+    del docs[SUMMARY_META_DOC]
+    return docs
+
+
+def get_monthly_summaries(db, uid):
+    """Get {YYYY-MM: summary} for a user, or None if summaries were never built for this account"""
+    return _load_summaries(db, uid, get_data_version(uid))
+
+
+def expect_transaction_update(uid):
+    """Tell the user's listener (if any) that a write is about to be committed from this process"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener:
+        listener.expect_update()
+
+
+def remember_transactions(uid, docs):
+    """Tell the user's listener (if any) about transactions {id: data} queued for writing from this process"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener:
+        listener.remember(docs)
+        # Indexes built from get_transactions (search, filters, dashboard) are keyed by the data version
+        bump_data_version(uid)
+
+
+def amend_transactions(uid, updates):
+    """Tell the user's listener (if any) about field updates {id: fields} queued from this process"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener:
+        listener.amend(updates)
+        bump_data_version(uid)
+
+
+def settle_transactions(uid, counts, written=True):
+    """Tell the user's listener (if any) that queued writes {id: count} were written (or cancelled, written=False)"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener and counts:
+        listener.settle(counts, written)
+        bump_data_version(uid)
+
+
+def forget_transactions(uid, tx_ids=None):
+    """Tell the user's listener (if any) that transactions were deleted from this process (None: not sure which)"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener:
+        listener.forget(tx_ids)
+        if tx_ids is not None:
+            bump_data_version(uid)
+
+
+def drop_pending_transactions(uid):
+    """Tell the user's listener (if any) that every transaction write queued for them was dropped"""
+    listener = _listener_registry()["listeners"].get(uid)
+    if listener:
+        listener.drop_pending()
+        bump_data_version(uid)
+
+
+def discard_transactions(uid):
+    """Stop the user's listener and remove their on-disk snapshot (account deletion)"""
+    registry = _listener_registry()
+    with registry["lock"]:
+        listener = registry["listeners"].pop(uid, None)
+    if listener:
+        listener.close()
+    delete_snapshot(uid)
+
+
+def invalidate_transactions(uid):
+    """Invalidate every cached read for this user after a write (other users' entries are untouched)"""
+    bump_data_version(uid)
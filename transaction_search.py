@@ -0,0 +1,119 @@
+# Description search for WalletGenie.
+# Each user's descriptions are tokenized into an inverted index (token -> transaction IDs), and the
+# token vocabulary gets a trigram index, so substring and prefix queries only scan the few
+# vocabulary entries that can match instead of every description. The index lives with the user's
+# transaction listener (so it goes when the listener is closed), is refreshed when the user's data
+# version changes, and then only patched for the transactions that were added, edited or deleted.
+import re
+import threading
+
+import streamlit as st
+
+from data_cache import get_data_version
+from transaction_repository import get_derived_state, get_transactions
+
+TOKEN_PATTERN = re.compile(r"\w+")
+GRAM_SIZE = 3
+
+
+def tokenize(text):
+    """Lowercase word tokens of a description or query"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _grams(token):
+    return {token[i:i + GRAM_SIZE] for i in range(len(token) - GRAM_SIZE + 1)}
+
+
+class DescriptionIndex:
+    """Inverted index over one user's transaction descriptions"""
+
+    def __init__(self):
+        self.data_version = None
+        self._descriptions = {}  # tx_id -> description as indexed
+        self._postings = {}  # token -> {tx_id}
+        self._token_grams = {}  # trigram -> {token}
+
+    def add(self, tx_id, description):
+        self._descriptions[tx_id] = description
+        for token in set(tokenize(description)):
+            if token not in self._postings:
+                self._postings[token] = set()
+                for gram in _grams(token):
+                    self._token_grams.setdefault(gram, set()).add(token)
+            self._postings[token].add(tx_id)
+
+    def remove(self, tx_id):
+        description = self._descriptions.pop(tx_id, None)
+        if description is None:
+            return
+        for token in set(tokenize(description)):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(tx_id)
+            if not postings:
+                # Last use of this token: drop it from the vocabulary as well
+                del self._postings[token]
+                for gram in _grams(token):
+                    self._token_grams[gram].discard(token)
+                    if not self._token_grams[gram]:
+                        del self._token_grams[gram]
+
+    def sync(self, ids, descriptions):
+        """Patch the index to match the given transactions (adds, description edits and deletes)"""
+        current = dict(zip(ids, descriptions))
+        for tx_id in self._descriptions.keys() - current.keys():
+            self.remove(tx_id)
+        for tx_id, description in current.items():
+            indexed = self._descriptions.get(tx_id)
+            if indexed != description:
+                if indexed is not None:
+                    self.remove(tx_id)
+                self.add(tx_id, description)
+
+    def _matching_tokens(self, term):
+        """Vocabulary tokens containing term (so prefixes and inner substrings both match)"""
+        if len(term) < GRAM_SIZE:
+            # Too short for the trigram index; the vocabulary is small enough to scan
+            return [token for token in self._postings if term in token]
+        gram_sets = sorted((self._token_grams.get(gram, set()) for gram in _grams(term)), key=len)
+        candidates = set.intersection(*gram_sets) if gram_sets else set()
+        # Trigrams can match out of order, so confirm the substring
+        return [token for token in candidates if term in token]
+
+    def search(self, query):
+        """IDs of transactions whose description contains every whitespace-separated term of query"""
+        result = None
+        for term in sorted(set(tokenize(query)), key=len, reverse=True):
+            matches = set()
+            for token in self._matching_tokens(term):
+                matches |= self._postings[token]
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result if result is not None else set(self._descriptions)
+
+
+@st.cache_resource(show_spinner=False)
+def _index_lock():
+    """Process-wide lock around every user's DescriptionIndex, shared by every session"""
+    return threading.Lock()
+
+
+def search_descriptions(db, uid, query):
+    """IDs of the user's transactions whose description contains every term of query"""
+    lock = _index_lock()
+    state = get_derived_state(db, uid)
+    data_version = get_data_version(uid)
+    with lock:
+        index = state.get("description_index")
+    if index is None or index.data_version != data_version:
+        # Built on first use, then only patched with what changed since the indexed data version
+        df = get_transactions(db, uid)
+        with lock:
+            index = state.setdefault("description_index", DescriptionIndex())
+            index.sync(df["id"], df["description"])
+            index.data_version = data_version
+    with lock:
+        return index.search(query)
@@ -0,0 +1,66 @@
+# On-disk transaction snapshots for WalletGenie.
+# Each user's normalized transactions are kept in an Arrow IPC file together with a watermark: the
+# Firestore read time the file is current to. After a restart the file is memory-mapped back in and
+# only documents whose updated_at is at or after the watermark have to be fetched from Firestore.
+import os
+from datetime import datetime
+
+import pyarrow as pa
+
+SNAPSHOT_DIR = os.environ.get("WALLETGENIE_CACHE_DIR", os.path.join(".cache", "transactions"))
+
+# Bump when the stored columns change; files written in another format are ignored and rebuilt
+SNAPSHOT_FORMAT = "2"
+SNAPSHOT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("description", pa.string()),
+    ("amount_minor", pa.int64()),
+    ("date", pa.timestamp("ns")),
+    # Dictionary columns round-trip as pandas categoricals
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def snapshot_path(uid):
+    """Path of a user's snapshot file"""
+    if os.path.basename(uid) != uid:
+        raise ValueError(f"Invalid user id: {uid!r}")
+    return os.path.join(SNAPSHOT_DIR, f"{uid}.arrow")
+
+
+def load_snapshot(uid):
+    """Load (normalized DataFrame, watermark) from disk, or (None, None) if there is no usable snapshot"""
+    try:
+        with pa.memory_map(snapshot_path(uid)) as source:
+            reader = pa.ipc.open_file(source)
+            metadata = reader.schema.metadata or {}
+            if metadata.get(b"format") != SNAPSHOT_FORMAT.encode():
+                return None, None
+            df = reader.read_all().to_pandas()
+        watermark = datetime.fromisoformat(metadata[b"watermark"].decode())
+    except (OSError, KeyError, ValueError, pa.ArrowInvalid):
+        # Missing, truncated or unreadable: the caller falls back to a full read
+        return None, None
+    return df, watermark
+
+
+def save_snapshot(uid, df, watermark):
+    """Atomically write a user's normalized transactions and the read time they are current to"""
+    schema = SNAPSHOT_SCHEMA.with_metadata({"format": SNAPSHOT_FORMAT, "watermark": watermark.isoformat()})
+    table = pa.Table.from_pandas(df[SNAPSHOT_SCHEMA.names], schema=schema, preserve_index=False)
+    path = snapshot_path(uid)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def delete_snapshot(uid):
+    """Remove a user's snapshot file (account deletion)"""
+    try:
+        os.remove(snapshot_path(uid))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,282 @@
+# Write-behind queue for WalletGenie.
+# Pages hand transaction adds/edits/deletes and goal updates to a SQLite-backed queue and return at once;
+# a background thread coalesces whatever is pending per user into batched Firestore writes, retrying
+# with exponential backoff. Queued writes survive a server restart and are flushed on the next start.
+# Reads see queued writes immediately: the listener and the goal lookup are updated optimistically,
+# and the listener is told when each queued transaction write has been written or cancelled.
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+import streamlit as st
+
+from data_cache import update_cached_lookup
+from firebase_init import init_firestore
+from shared_utils import MAX_BATCH_TRANSACTIONS, add_transactions, delete_transactions, update_goal, update_transactions
+from transaction_repository import (
+    amend_transactions, drop_pending_transactions, forget_transactions, remember_transactions, settle_transactions,
+)
+
+QUEUE_PATH = os.environ.get("WALLETGENIE_WRITE_QUEUE", os.path.join(".cache", "write_queue.sqlite3"))
+
+# Writes queued within this window are flushed together
+COALESCE_SECONDS = 0.2
+# Backoff after a failed flush: RETRY_BASE_SECONDS * 2^attempts, capped, with jitter
+RETRY_BASE_SECONDS = 1
+RETRY_MAX_SECONDS = 5 * 60
+# After this many attempts a write is marked failed and kept for a manual retry
+MAX_WRITE_ATTEMPTS = 10
+# Queue ops that write transaction documents (everything but goal updates)
+TRANSACTION_OPS = ("add_transaction", "delete_transaction", "update_transaction")
+
+
+class WriteQueue:
+    """Durable queue of pending Firestore writes, flushed by a daemon thread"""
+
+    def __init__(self, db, path=QUEUE_PATH):
+        self.db = db
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_writes ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, uid TEXT NOT NULL, op TEXT NOT NULL, payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0,"
+            " failed INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()  # Held while a user's writes are being sent
+        self._wake = threading.Event()
+        self._wake.set()  # Flush anything left over from a previous run
+        threading.Thread(target=self._run, name="write-queue", daemon=True).start()
+
+    def _enqueue(self, uid, writes):
+        """Store (op, payload) writes for a user in one SQLite transaction and wake the flusher"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO pending_writes (uid, op, payload) VALUES (?, ?, ?)",
+                    [(uid, op, json.dumps(payload)) for op, payload in writes],
+                )
+        self._wake.set()
+
+    def add_transactions(self, uid, transactions):
+        """Queue new transactions; they show up in get_transactions right away. Returns their IDs."""
+        tx_ids = [str(uuid.uuid4()) for _ in transactions]
+        self._enqueue(uid, [("add_transaction", {"tx_id": tx_id, "tx_data": tx_data}) for tx_id, tx_data in zip(tx_ids, transactions)])
+        remember_transactions(uid, dict(zip(tx_ids, transactions)))
+        return tx_ids
+
+    def delete_transactions(self, uid, tx_ids):
+        """Queue transaction deletes; they disappear from get_transactions and pending_deletes covers pages"""
+        self._enqueue(uid, [("delete_transaction", {"tx_id": tx_id}) for tx_id in tx_ids])
+        forget_transactions(uid, list(tx_ids))
+
+    def update_transactions(self, uid, updates):
+        """Queue field updates {tx_id: changed fields}; get_transactions and pending_updates reflect them right away"""
+        self._enqueue(uid, [("update_transaction", {"tx_id": tx_id, "fields": fields}) for tx_id, fields in updates.items()])
+        amend_transactions(uid, updates)
+
+    def update_goal(self, uid, goal_id, goal_data):
+        """Queue a goal update; get_goals returns the updated goal right away"""
+        self._enqueue(uid, [("update_goal", {"goal_id": goal_id, "goal_data": goal_data})])
+        update_cached_lookup(uid, "goals", lambda goals: [{**goal, **goal_data} if goal["id"] == goal_id else goal for goal in goals])
+
+    def pending_deletes(self, uid):
+        """IDs of this user's transactions with a delete still queued (for pages that query Firestore directly)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM pending_writes WHERE uid = ? AND op = 'delete_transaction'", (uid,)
+            ).fetchall()
+        return {json.loads(payload)["tx_id"] for (payload,) in rows}
+
+    def pending_updates(self, uid):
+        """{tx_id: changed fields} still queued for this user, oldest first (for pages that query Firestore directly)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM pending_writes WHERE uid = ? AND op = 'update_transaction' ORDER BY seq", (uid,)
+            ).fetchall()
+        updates = {}
+        for (payload,) in rows:
+            payload = json.loads(payload)
+            updates[payload["tx_id"]] = {**updates.get(payload["tx_id"], {}), **payload["fields"]}
+        return updates
+
+    def status(self, uid):
+        """(pending, failed) write counts for a user"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) - COALESCE(SUM(failed), 0), COALESCE(SUM(failed), 0) FROM pending_writes WHERE uid = ?", (uid,)
+            ).fetchone()
+        return int(row[0]), int(row[1])
+
+    def retry_failed(self, uid):
+        """Give a user's failed writes another round of attempts"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pending_writes SET failed = 0, attempts = 0, next_attempt = 0 WHERE uid = ? AND failed = 1", (uid,)
+            )
+        self._wake.set()
+
+    def discard(self, uid, ops=None):
+        """Drop a user's queued writes (only the given ops, if any), waiting for a flush in progress to finish"""
+        with self._flushing, self._lock:
+            if ops is None:
+                self._conn.execute("DELETE FROM pending_writes WHERE uid = ?", (uid,))
+            else:
+                self._conn.execute(
+                    f"DELETE FROM pending_writes WHERE uid = ? AND op IN ({', '.join('?' * len(ops))})", (uid, *ops)
+                )
+        # The listener would otherwise keep showing the dropped adds, edits and deletes
+        drop_pending_transactions(uid)
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=RETRY_BASE_SECONDS)
+            self._wake.clear()
+            time.sleep(COALESCE_SECONDS)
+            try:
+                self._flush_due()
+            except Exception as e:
+                logging.error(f"Write queue flush failed: {e}")
+
+    def _flush_due(self):
+        """Flush the writes of every user with a write due, one user at a time"""
+        # All of a user's pending writes are coalesced together, so a delete is never sent ahead of its
+        # own add; only the groups whose rows are all due are written
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, uid, op, payload, attempts, next_attempt FROM pending_writes WHERE failed = 0 AND uid IN"
+                " (SELECT uid FROM pending_writes WHERE failed = 0 AND next_attempt <= ?) ORDER BY seq",
+                (now,),
+            ).fetchall()
+        by_user = {}
+        for seq, uid, op, payload, attempts, next_attempt in rows:
+            by_user.setdefault(uid, []).append((seq, op, json.loads(payload), attempts, next_attempt <= now))
+        for uid, writes in by_user.items():
+            with self._flushing:
+                # Re-check under the flush lock: discard() may have dropped this user's writes meanwhile
+                with self._lock:
+                    remaining = {seq for (seq,) in self._conn.execute("SELECT seq FROM pending_writes WHERE uid = ?", (uid,))}
+                writes = [write for write in writes if write[0] in remaining]
+                if writes:
+                    self._flush_user(uid, writes)
+
+    def _flush_user(self, uid, writes):
+        """Coalesce one user's writes and apply them; each group of writes succeeds or is retried on its own"""
+        adds = {}  # tx_id -> (seqs, tx_data)
+        deletes = {}  # tx_id -> seqs
+        updates = {}  # tx_id -> (seqs, merged changed fields)
+        goal_updates = {}  # goal_id -> (seqs, merged goal_data)
+        dropped = set()  # Transactions added and deleted within this flush
+        cancelled = []
+        tx_of = {seq: payload.get("tx_id") for seq, _, payload, _, _ in writes}  # seq -> transaction it touches
+        for seq, op, payload, _, _ in writes:
+            if op == "add_transaction":
+                adds[payload["tx_id"]] = ([seq], payload["tx_data"])
+            elif op == "delete_transaction":
+                tx_id = payload["tx_id"]
+                if tx_id in updates:
+                    # Edits to a transaction that is about to be deleted don't need writing
+                    cancelled += updates.pop(tx_id)[0]
+                if tx_id in adds:
+                    # Added and deleted before either reached Firestore: write neither
+                    cancelled += adds.pop(tx_id)[0] + [seq]
+                    dropped.add(tx_id)
+                else:
+                    deletes.setdefault(tx_id, []).append(seq)
+            elif op == "update_transaction":
+                tx_id = payload["tx_id"]
+                if tx_id in adds:
+                    # Not written yet: fold the edit into the add
+                    seqs, tx_data = adds[tx_id]
+                    adds[tx_id] = (seqs + [seq], {**tx_data, **payload["fields"]})
+                elif tx_id in deletes or tx_id in dropped:
+                    cancelled.append(seq)
+                else:
+                    seqs, fields = updates.get(tx_id, ([], {}))
+                    updates[tx_id] = (seqs + [seq], {**fields, **payload["fields"]})
+            elif op == "update_goal":
+                seqs, goal_data = goal_updates.get(payload["goal_id"], ([], {}))
+                goal_updates[payload["goal_id"]] = (seqs + [seq], {**goal_data, **payload["goal_data"]})
+        if deletes:
+            # A delete also cancels an add of the same transaction that already gave up
+            with self._lock:
+                failed_adds = self._conn.execute(
+                    "SELECT seq, payload FROM pending_writes WHERE uid = ? AND op = 'add_transaction' AND failed = 1", (uid,)
+                ).fetchall()
+            for seq, payload in failed_adds:
+                tx_id = json.loads(payload)["tx_id"]
+                if tx_id in deletes:
+                    cancelled += deletes.pop(tx_id) + [seq]
+                    tx_of[seq] = tx_id
+        self._done(uid, cancelled, tx_of, written=False)
+        attempts = {seq: count for seq, _, _, count, _ in writes}
+        due = {seq: is_due for seq, _, _, _, is_due in writes}
+
+        self._write_chunks(uid, {tx_id: seqs for tx_id, (seqs, _) in adds.items()}, attempts, due, tx_of, lambda chunk: (
+            add_transactions, self.db, uid, [adds[tx_id][1] for tx_id in chunk], chunk,
+        ))
+        self._write_chunks(uid, {tx_id: seqs for tx_id, (seqs, _) in updates.items()}, attempts, due, tx_of, lambda chunk: (
+            update_transactions, self.db, uid, {tx_id: updates[tx_id][1] for tx_id in chunk},
+        ))
+        self._write_chunks(uid, deletes, attempts, due, tx_of, lambda chunk: (
+            delete_transactions, self.db, uid, chunk,
+        ))
+        for goal_id, (seqs, goal_data) in goal_updates.items():
+            if all(due[seq] for seq in seqs):
+                self._apply(uid, seqs, attempts, tx_of, update_goal, self.db, uid, goal_id, goal_data)
+
+    def _write_chunks(self, uid, groups, attempts, due, tx_of, make_write):
+        """Write coalesced groups {tx_id: seqs} whose rows are all due, in chunks that shrink as their rows keep failing"""
+        by_attempts = {}
+        for tx_id, seqs in groups.items():
+            # Groups still backing off wait for their own retry time
+            if all(due[seq] for seq in seqs):
+                by_attempts.setdefault(max(attempts[seq] for seq in seqs), []).append(tx_id)
+        for attempt, tx_ids in by_attempts.items():
+            # The rows at this attempt count are the ones whose chunk failed last time; splitting them
+            # exponentially smaller each attempt isolates one bad row in a few rounds instead of failing
+            # every row it was batched with until they all give up
+            size = min(MAX_BATCH_TRANSACTIONS, max(1, len(tx_ids) >> attempt))
+            for start in range(0, len(tx_ids), size):
+                chunk = tx_ids[start:start + size]
+                self._apply(uid, [seq for tx_id in chunk for seq in groups[tx_id]], attempts, tx_of, *make_write(chunk))
+
+    def _apply(self, uid, seqs, attempts, tx_of, write, *args):
+        """Run one Firestore write for the given queue rows, removing them on success and backing off on failure"""
+        try:
+            write(*args)
+        except Exception as e:
+            attempt = max(attempts[seq] for seq in seqs) + 1
+            delay = min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS) * random.uniform(0.5, 1.0)
+            failed = attempt >= MAX_WRITE_ATTEMPTS
+            logging.warning(f"{write.__name__} failed (attempt {attempt}){', giving up' if failed else ''}: {e}")
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE pending_writes SET attempts = ?, next_attempt = ?, failed = ?, last_error = ? WHERE seq = ?",
+                    [(attempt, time.time() + delay, int(failed), str(e), seq) for seq in seqs],
+                )
+            return
+        self._done(uid, seqs, tx_of)
+
+    def _done(self, uid, seqs, tx_of, written=True):
+        """Remove finished (or cancelled) rows and let the listener settle the transactions they touched"""
+        if seqs:
+            with self._lock:
+                self._conn.executemany("DELETE FROM pending_writes WHERE seq = ?", [(seq,) for seq in seqs])
+            settle_transactions(uid, Counter(tx_of[seq] for seq in seqs if tx_of.get(seq)), written)
+
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue():
+    """Get the process-wide write queue (starts its flush thread on first use)"""
+    return WriteQueue(init_firestore())